@@ -0,0 +1,204 @@
+"""
+Deterministic upstream data for the benchmarks.
+
+Records mirror the shape of the upstream responses used by the collector
+(only the fields the collector reads plus a few bulky ones). Volumes are
+multiplied by `scale`, countries are always the full ISO list.
+"""
+import os
+import json
+import random
+from datetime import date, timedelta
+
+import pycountry
+
+COUNTRY_ISO3_FILENAME = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'collector', 'data', 'country_iso3.json',
+)
+
+# Records per scale unit
+GO_APPEALS = 500
+RELIEFWEB_DISASTERS = 500
+ACLED_EVENTS = 5000
+STARTNETWORK_ALERTS = 200
+HPC_EMERGENCIES = 2
+CLIMATE_MODELS = 15
+
+DISASTER_TYPES = 20
+DATE_FROM = date(2005, 1, 1)
+DATE_DAYS = (date(2025, 12, 31) - DATE_FROM).days
+YEARS = list(range(2008, 2019 + 1))
+ACLED_TIMESTAMP_FROM = 1500000000
+ACLED_EVENT_TYPES = [
+    'Battles', 'Riots/Protests', 'Violence against civilians', 'Remote violence',
+    'Strategic development', 'Non-violent transfer of territory',
+]
+RELIEFWEB_NAMES = [
+    'Cholera outbreak', 'Meningitis', 'Rift Valley fever', 'Viral haemorrhagic fevers',
+    'Viral hepatitis A B C E', 'Yellow fever',
+    'Floods', 'Earthquake', 'Tropical Cyclone', 'Drought', 'Cold Wave', 'Land Slide',
+]
+RELIEFWEB_TYPES = [
+    ('FL', 'Flood'), ('EQ', 'Earthquake'), ('TC', 'Tropical Cyclone'), ('DR', 'Drought'),
+    ('FR', 'Fire'), ('CW', 'Cold Wave'), ('LS', 'Land Slide'), ('OT', 'Other'),
+]
+STARTNETWORK_CRISIS_TYPES = [
+    'Flooding', 'Drought', 'Conflict', 'Displacement', 'Epidemic', 'Heatwave', 'Cyclone',
+]
+# Alert countries without an ISO country
+STARTNETWORK_UNKNOWN_COUNTRIES = ['Sahel Region', 'Lake Chad Basin']
+# Countries which are not World Bank economies (requests with these are rejected)
+WORLD_BANK_UNKNOWN_ISO3 = ['ATA', 'ATF', 'BVT', 'ESH', 'HMD', 'IOT', 'TWN', 'UMI']
+
+
+def get_date(rng):
+    return DATE_FROM + timedelta(days=rng.randrange(DATE_DAYS))
+
+
+class Fixtures():
+
+    def __init__(self, scale=1):
+        self.scale = scale
+        self.countries = self.get_countries()
+        self.appeal_count = GO_APPEALS * scale
+        self.acled_count = ACLED_EVENTS * scale
+        self.disasters = [self.get_disaster(index) for index in range(RELIEFWEB_DISASTERS * scale)]
+
+    @staticmethod
+    def get_countries():
+        with open(COUNTRY_ISO3_FILENAME) as fp:
+            country_iso3 = json.load(fp)
+        countries = []
+        for index, iso2 in enumerate(sorted(country_iso3)):
+            country = pycountry.countries.get(alpha_2=iso2)
+            countries.append({
+                'id': index + 1,
+                'iso': iso2.lower(),
+                'iso3': country_iso3[iso2],
+                'name': country.name if country else iso2,
+                'region': index % 5,
+            })
+        return countries
+
+    # GO
+    def get_appeal(self, index):
+        rng = random.Random(index)
+        country = self.countries[rng.randrange(len(self.countries))]
+        start_date = get_date(rng)
+        return {
+            'id': index + 1,
+            'aid': str(index + 1),
+            'code': 'MDR{:05d}'.format(index + 1),
+            'name': 'Appeal {}'.format(index + 1),
+            'atype': rng.randint(0, 2),
+            'status': rng.randint(0, 2),
+            'dtype': {'id': rng.randint(1, DISASTER_TYPES)},
+            'num_beneficiaries': rng.randint(0, 100000),
+            'amount_requested': float(rng.randint(0, 10 ** 7)),
+            'amount_funded': float(rng.randint(0, 10 ** 7)),
+            'start_date': '{}T00:00:00Z'.format(start_date.isoformat()),
+            'end_date': '{}T00:00:00Z'.format((start_date + timedelta(days=90)).isoformat()),
+            'created_at': '{}T00:00:00Z'.format(start_date.isoformat()),
+            'modified_at': '{}T00:00:00Z'.format(start_date.isoformat()),
+            'needs_confirmation': False,
+            'event': {'id': index + 1, 'name': 'Event {}'.format(index + 1)},
+            'country': {'id': country['id'], 'iso': country['iso'], 'name': country['name']},
+            'region': None if rng.random() < 0.05 else {'id': country['region']},
+        }
+
+    def get_disaster_types(self):
+        return [
+            {'id': dtype, 'name': 'Disaster type {}'.format(dtype)}
+            for dtype in range(1, DISASTER_TYPES + 1)
+        ]
+
+    # ReliefWeb
+    def get_disaster(self, index):
+        rng = random.Random(index)
+        country = self.countries[rng.randrange(len(self.countries))]
+        primary_type = RELIEFWEB_TYPES[rng.randrange(len(RELIEFWEB_TYPES))]
+        return {
+            'id': index + 1,
+            'name': RELIEFWEB_NAMES[rng.randrange(len(RELIEFWEB_NAMES))],
+            'glide': '{}-{}-{:06d}'.format(primary_type[0], 2000, index),
+            'current': rng.random() < 0.1,
+            'url': 'https://reliefweb.int/node/{}'.format(index + 1),
+            'description': 'Disaster description. ' * rng.randint(10, 100),
+            'date': {'created': '{}T00:00:00+00:00'.format(get_date(rng).isoformat())},
+            'country': [{'iso3': country['iso3'].lower(), 'name': country['name']}],
+            'primary_country': {'iso3': country['iso3'].lower(), 'name': country['name']},
+            'primary_type': {'code': primary_type[0], 'name': primary_type[1]},
+        }
+
+    # ACLED (timestamp grows with the index, so timestamp filters are index ranges)
+    def get_event(self, index):
+        rng = random.Random(index)
+        event_date = get_date(rng)
+        return {
+            'data_id': str(index + 1),
+            'iso3': self.countries[rng.randrange(len(self.countries))]['iso3'],
+            'year': str(event_date.year),
+            'event_date': event_date.isoformat(),
+            'event_type': ACLED_EVENT_TYPES[rng.randrange(len(ACLED_EVENT_TYPES))],
+            'timestamp': str(ACLED_TIMESTAMP_FROM + index),
+        }
+
+    # StartNetwork
+    def get_alerts_csv(self):
+        rng = random.Random(0)
+        names = [country['name'] for country in self.countries] + STARTNETWORK_UNKNOWN_COUNTRIES
+        lines = ['Alert,Country,Crisis Type,Date,Amount Awarded']
+        for index in range(STARTNETWORK_ALERTS * self.scale):
+            country = names[rng.randrange(len(names))]
+            if rng.random() < 0.2:
+                country = '{} [Region {}]'.format(country, rng.randint(1, 5))
+            lines.append('{},"{}",{},{},{}'.format(
+                index + 1, country,
+                STARTNETWORK_CRISIS_TYPES[rng.randrange(len(STARTNETWORK_CRISIS_TYPES))],
+                get_date(rng).isoformat(), rng.randint(10000, 1000000),
+            ))
+        return '\n'.join(lines) + '\n'
+
+    # HPC
+    def get_funds(self, iso3):
+        rng = random.Random(iso3)
+        return {'data': {'report3': {
+            fund_area: {'objects': [{'objectsBreakdown': [
+                {'name': str(year), 'totalFunding': rng.randint(0, 10 ** 8)}
+                for year in YEARS
+            ]}]}
+            for fund_area in ['fundingTotals', 'pledgeTotals']
+        }}}
+
+    def get_emergencies(self, iso3):
+        rng = random.Random('emergency-' + iso3)
+        return {'data': [
+            {
+                'id': index,
+                'name': 'Emergency {}'.format(index),
+                'date': '{}T00:00:00.000Z'.format(get_date(rng).isoformat()),
+            }
+            for index in range(rng.randint(0, 2 * HPC_EMERGENCIES * self.scale))
+        ]}
+
+    # World Bank
+    def get_indicator_value(self, iso3, indicator, year):
+        rng = random.Random('{}-{}-{}'.format(iso3, indicator, year))
+        return None if rng.random() < 0.02 else rng.randint(10 ** 4, 10 ** 9)
+
+    # World Bank climate (mavg: monthly values of each climate model)
+    def get_climate(self, iso3, var, from_year, to_year):
+        rng = random.Random('{}-{}'.format(iso3, var))
+        if rng.random() < 0.05:
+            return []
+        return [
+            {
+                'gcm': 'gcm_{}'.format(index),
+                'variable': var,
+                'fromYear': from_year,
+                'toYear': to_year,
+                'monthVals': [rng.uniform(0, 300) for _ in range(12)],
+            }
+            for index in range(CLIMATE_MODELS)
+        ]
@@ -0,0 +1,187 @@
+"""
+Offline benchmarks: end-to-end collect() and summary builds against the
+fixture server (no credentials or network required).
+
+    python -m benchmarks.run --scales 1,10,100 --output benchmarks/results.json
+    python -m benchmarks.run --baseline benchmarks/results.json  # exit 1 on regressions
+
+For each data volume (scale) reports:
+    collect_seconds, countries_per_second, peak_memory_mb (tracemalloc),
+    requests/retries (see collector.metrics) and summary_seconds by source
+"""
+import io
+import sys
+import json
+import time
+import shutil
+import tempfile
+import tracemalloc
+import contextlib
+
+import click
+
+from collector.config import settings, HttpSettings
+from collector.http_client import get_client
+from collector.metrics import metrics
+from collector import country, go_api
+from collector.main import GoDataSourceCollector
+from collector.acled_api import AcledApi
+from collector.go_api import GoApi
+from collector.startnetwork import StartNetworkApi
+
+from .server import start_server, get_host_rewrites
+
+# Only regressions above this are reported (seconds/MB)
+MIN_REGRESSION = {'seconds': 0.05, 'memory': 5}
+
+
+def clear_caches():
+    # Cached data from the previous scale
+    for function in [
+            country.get_country_iso3_map, country.get_country_iso2_map,
+            country.get_country_api, country.get_country_index, go_api.get_disaster_types,
+    ]:
+        function.cache_clear()
+
+
+def time_call(function, *args):
+    start = time.time()
+    function(*args)
+    return time.time() - start
+
+
+def run_scale(scale, workers, latency, error_rate, http_cache, host_limits, verbose):
+    process, base_url = start_server(scale=scale, latency=latency, error_rate=error_rate)
+    path = tempfile.mkdtemp(prefix='ifrc-benchmark-')
+    HttpSettings.host_rewrites = get_host_rewrites(base_url)
+    if not host_limits:
+        HttpSettings.host_limits = {}
+        HttpSettings.default_host_limit = (HttpSettings.pool_size,) * 3
+    settings.output_dir = path
+    clear_caches()
+    get_client().set_cache(None)
+    metrics.reset()
+
+    output = None if verbose else io.StringIO()
+    try:
+        with contextlib.redirect_stdout(output or sys.stdout):
+            tracemalloc.start()
+            start = time.time()
+            collector = GoDataSourceCollector(
+                path=path, hpc_credential='benchmark:benchmark',
+                workers=workers, http_cache=http_cache,
+            )
+            collector.collect(output_file='{}/output.json'.format(path))
+            collect_seconds = time.time() - start
+            peak_memory = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+
+            summary_seconds = {
+                'acled': time_call(
+                    AcledApi.get_summaries, collector.acledApi.store.iter_chunks(),
+                ),
+                'go_api': time_call(GoApi.get_summary, collector.goApi.data),
+                'startnetwork': time_call(
+                    StartNetworkApi.get_summary, collector.startnetwork.data,
+                ),
+            }
+    finally:
+        if tracemalloc.is_tracing():
+            tracemalloc.stop()
+        process.terminate()
+        shutil.rmtree(path, ignore_errors=True)
+
+    report = metrics.report()
+    countries = len(collector.fingerprints)
+    return {
+        'scale': scale,
+        'countries': countries,
+        'collect_seconds': collect_seconds,
+        'countries_per_second': countries / collect_seconds,
+        'peak_memory_mb': peak_memory / 1024 ** 2,
+        'requests': sum(host['requests'] for host in report['requests'].values()),
+        'retries': sum(host['retries'] for host in report['requests'].values()),
+        'summary_seconds': summary_seconds,
+    }
+
+
+def get_regressions(results, baseline, tolerance):
+    """
+    returns list of (scale, metric, baseline value, value)
+    """
+    baseline = {result['scale']: result for result in baseline}
+    regressions = []
+    for result in results:
+        base = baseline.get(result['scale'])
+        if base is None:
+            continue
+        values = [
+            ('collect_seconds', base['collect_seconds'], result['collect_seconds'], 'seconds'),
+            ('peak_memory_mb', base['peak_memory_mb'], result['peak_memory_mb'], 'memory'),
+        ] + [
+            (
+                'summary_seconds.{}'.format(source), base['summary_seconds'].get(source),
+                seconds, 'seconds',
+            )
+            for source, seconds in result['summary_seconds'].items()
+        ]
+        for metric, base_value, value, unit in values:
+            if base_value is not None and value > base_value * (1 + tolerance) and \
+                    value - base_value > MIN_REGRESSION[unit]:
+                regressions.append((result['scale'], metric, base_value, value))
+    return regressions
+
+
+def print_result(result):
+    print(
+        '{scale:>4}x  collect: {collect_seconds:8.2f}s ({countries_per_second:6.1f} countries/s)'
+        '  peak memory: {peak_memory_mb:8.1f}MB  requests: {requests:6d}'
+        ' (retries: {retries})'.format(**result)
+    )
+    print('       summaries: {}'.format(', '.join(
+        '{}: {:.3f}s'.format(source, seconds)
+        for source, seconds in result['summary_seconds'].items()
+    )))
+
+
+@click.command()
+@click.option('--scales', default='1,10,100', help='Data volumes, comma separated')
+@click.option('--workers', default=8, type=int, help='Countries collected concurrently')
+@click.option('--latency', default=0.0, type=float, help='Seconds added to every response')
+@click.option('--error-rate', default=0.0, type=float, help='Share of 503 responses')
+@click.option(
+    '--http-cache/--no-http-cache', default=False, help='Use the http response cache'
+)
+@click.option(
+    '--host-limits/--no-host-limits', default=False,
+    help='Keep the per host rate limits (HttpSettings.host_limits), these dominate the run time'
+)
+@click.option('--output', default=None, help='Save results as json')
+@click.option('--baseline', default=None, help='Compare with saved results')
+@click.option('--tolerance', default=0.25, type=float, help='Allowed slowdown over baseline')
+@click.option('--verbose', is_flag=True, default=False, help='Show collector output')
+def run(
+        scales, workers, latency, error_rate, http_cache, host_limits, output, baseline,
+        tolerance, verbose,
+):
+    results = []
+    for scale in [int(scale) for scale in scales.split(',')]:
+        result = run_scale(scale, workers, latency, error_rate, http_cache, host_limits, verbose)
+        print_result(result)
+        results.append(result)
+
+    if output:
+        with open(output, 'w') as fp:
+            json.dump(results, fp, indent=2)
+
+    if baseline:
+        with open(baseline) as fp:
+            regressions = get_regressions(results, json.load(fp), tolerance)
+        for scale, metric, base_value, value in regressions:
+            print('Regression {}x {}: {:.3f} -> {:.3f}'.format(scale, metric, base_value, value))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    run()
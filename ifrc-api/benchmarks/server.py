@@ -0,0 +1,387 @@
+"""
+Local stand-in for the upstream APIs, serving benchmark fixtures.
+
+Runs in its own process (so it doesn't share memory/GIL with the measured
+collector). Requests are sent to http://127.0.0.1:<port>/<original host>/<path>
+(see get_host_rewrites and HttpSettings.host_rewrites).
+
+latency: seconds added to every response
+error_rate: share of requests answered with 503 (Retry-After: 0)
+"""
+import re
+import json
+import time
+import random
+import hashlib
+import threading
+import multiprocessing
+from urllib.parse import urlparse, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from .fixtures import Fixtures, ACLED_TIMESTAMP_FROM, WORLD_BANK_UNKNOWN_ISO3
+
+UPSTREAM_URLS = [
+    'https://api.reliefweb.int',
+    'https://prddsgocdnapi.azureedge.net',
+    'http://dsgocdnapi.azureedge.net',
+    'https://api.acleddata.com',
+    'https://startnetwork.org',
+    'https://api.hpc.tools',
+    'http://api.worldbank.org',
+    'https://api.worldbank.org',
+    'http://climatedataapi.worldbank.org',
+    'http://country.io',
+]
+STARTNETWORK_LAST_MODIFIED = 'Mon, 01 Jan 2018 00:00:00 GMT'
+# World Bank error bodies (sent with 200) for unknown country and indicator codes
+WORLD_BANK_INVALID_VALUE = [{'message': [{
+    'id': '120', 'key': 'Invalid value', 'value': 'The provided parameter value is not valid',
+}]}]
+WORLD_BANK_INDICATOR_NOT_FOUND = [{'message': [{
+    'id': '175', 'key': 'Invalid format',
+    'value': 'The indicator was not found. It may have been deleted or archived.',
+}]}]
+# Shape of World Bank indicator codes (e.g. SP.POP.TOTL), others are unknown
+WORLD_BANK_INDICATOR_RE = re.compile(r'^[A-Z0-9_]+(\.[A-Z0-9_]+)+$')
+
+
+def get_host_rewrites(base_url):
+    return {
+        upstream_url: '{}/{}'.format(base_url, urlparse(upstream_url).netloc)
+        for upstream_url in UPSTREAM_URLS
+    }
+
+
+def json_response(data, status=200):
+    return status, {'Content-Type': 'application/json'}, json.dumps(data).encode('utf-8')
+
+
+def get_page(records, offset, limit):
+    return records[offset:offset + limit]
+
+
+# ReliefWeb filters/sort
+def get_field(record, field):
+    value = record
+    for key in field.split('.'):
+        if isinstance(value, list):
+            value = [item.get(key) for item in value]
+        elif isinstance(value, dict):
+            value = value.get(key)
+        else:
+            return None
+    return value
+
+
+def match_condition(record, condition):
+    if 'conditions' in condition:
+        matches = [match_condition(record, _condition) for _condition in condition['conditions']]
+        matched = any(matches) if condition.get('operator') == 'OR' else all(matches)
+    else:
+        values = get_field(record, condition['field'])
+        values = values if isinstance(values, list) else [values]
+        expected = condition['value']
+        if isinstance(expected, dict):
+            matched = any(
+                value is not None and
+                value >= expected.get('from', '') and
+                (expected.get('to') is None or value <= expected['to'])
+                for value in values
+            )
+        else:
+            expected = {
+                str(value).lower()
+                for value in (expected if isinstance(expected, list) else [expected])
+            }
+            matched = any(str(value).lower() in expected for value in values)
+    return not matched if condition.get('negate') else matched
+
+
+def sort_records(records, sort):
+    for field_order in reversed(sort):
+        field, _, order = field_order.partition(':')
+        records = sorted(
+            records, key=lambda record: get_field(record, field) or '', reverse=order == 'desc',
+        )
+    return records
+
+
+class FixtureApi():
+    """
+    (method, host, path, query, headers, body) -> (status, headers, content)
+    """
+
+    def __init__(self, fixtures):
+        self.fixtures = fixtures
+        self.alerts_csv = fixtures.get_alerts_csv().encode('utf-8')
+        self.alerts_etag = '"{}"'.format(hashlib.sha1(self.alerts_csv).hexdigest())
+
+    def handle(self, method, host, path, query, headers, body):
+        handler = {
+            'api.reliefweb.int': self.reliefweb,
+            'prddsgocdnapi.azureedge.net': self.go,
+            'dsgocdnapi.azureedge.net': self.go,
+            'api.acleddata.com': self.acled,
+            'startnetwork.org': self.startnetwork,
+            'api.hpc.tools': self.hpc,
+            'api.worldbank.org': self.world_bank,
+            'climatedataapi.worldbank.org': self.climate,
+            'country.io': self.country_io,
+        }.get(host)
+        if handler is None:
+            return json_response({'error': 'Unknown host {}'.format(host)}, 404)
+        return handler(method, path, query, headers, body)
+
+    def reliefweb(self, method, path, query, headers, body):
+        if not path.startswith('/v1/disasters'):
+            return json_response({'totalCount': 0, 'count': 0, 'data': []})
+        payload = json.loads(body or b'{}')
+        records = self.fixtures.disasters
+        if payload.get('filter'):
+            records = [record for record in records if match_condition(record, payload['filter'])]
+        if payload.get('sort'):
+            records = sort_records(records, payload['sort'])
+        page = get_page(records, payload.get('offset', 0), payload.get('limit', 10))
+        include = {
+            field.split('.')[0] for field in payload.get('fields', {}).get('include', [])
+        }
+        return json_response({
+            'totalCount': len(records),
+            'count': len(page),
+            'data': [
+                {
+                    'id': str(record['id']),
+                    'fields': {
+                        key: value for key, value in record.items()
+                        if key in include or key == 'id'
+                    },
+                }
+                for record in page
+            ],
+        })
+
+    def go(self, method, path, query, headers, body):
+        limit = int(query.get('limit', 50))
+        offset = int(query.get('offset', 0))
+        if path.startswith('/api/v2/country'):
+            records = self.fixtures.countries
+        elif path.startswith('/api/v2/disaster_type'):
+            records = self.fixtures.get_disaster_types()
+        elif path.startswith('/api/v2/appeal'):
+            if 'country' in query:
+                records = [
+                    appeal for appeal in map(
+                        self.fixtures.get_appeal, range(self.fixtures.appeal_count)
+                    )
+                    if appeal['country']['id'] == int(query['country'])
+                ]
+            else:
+                return json_response({
+                    'count': self.fixtures.appeal_count,
+                    'results': [
+                        self.fixtures.get_appeal(index)
+                        for index in range(offset, min(offset + limit, self.fixtures.appeal_count))
+                    ],
+                })
+        else:
+            return json_response({'detail': 'Not found.'}, 404)
+        return json_response({'count': len(records), 'results': get_page(records, offset, limit)})
+
+    def acled(self, method, path, query, headers, body):
+        limit = int(query.get('limit', 500))
+        page = int(query.get('page', 1))
+        start = 0
+        if 'timestamp' in query:
+            start = max(int(query['timestamp']) - ACLED_TIMESTAMP_FROM, 0)
+            if query.get('timestamp_where') == '>':
+                start += 1
+        if limit == 0:
+            end = self.fixtures.acled_count
+        else:
+            start, end = start + (page - 1) * limit, start + page * limit
+        fields = query['fields'].split('|') if 'fields' in query else None
+        events = [
+            self.fixtures.get_event(index)
+            for index in range(start, min(end, self.fixtures.acled_count))
+        ]
+        if fields:
+            events = [{field: event.get(field) for field in fields} for event in events]
+        return json_response({'success': True, 'count': len(events), 'data': events})
+
+    def startnetwork(self, method, path, query, headers, body):
+        response_headers = {
+            'Content-Type': 'text/csv',
+            'ETag': self.alerts_etag,
+            'Last-Modified': STARTNETWORK_LAST_MODIFIED,
+        }
+        if (
+                headers.get('If-None-Match') == self.alerts_etag or
+                headers.get('If-Modified-Since') == STARTNETWORK_LAST_MODIFIED
+        ):
+            return 304, response_headers, b''
+        return 200, response_headers, self.alerts_csv
+
+    def hpc(self, method, path, query, headers, body):
+        if path.startswith('/v1/public/fts/flow'):
+            return json_response(self.fixtures.get_funds(query.get('countryISO3', '')))
+        if path.startswith('/v1/public/emergency/country/'):
+            return json_response(self.fixtures.get_emergencies(path.rstrip('/').split('/')[-1]))
+        return json_response({'status': 404}, 404)
+
+    def world_bank(self, method, path, query, headers, body):
+        parts = [part for part in path.split('/') if part]
+        if parts and parts[0] == 'v2':
+            parts = parts[1:]
+        if parts in (['country'], ['countries']):
+            # Economies (iso3 as id)
+            records = [
+                {
+                    'id': country['iso3'], 'iso2Code': country['iso'].upper(),
+                    'name': country['name'],
+                }
+                for country in self.fixtures.countries
+                if country['iso3'] not in WORLD_BANK_UNKNOWN_ISO3
+            ]
+            return json_response([
+                {'page': 1, 'pages': 1, 'per_page': len(records), 'total': len(records)},
+                records,
+            ])
+        if len(parts) != 4 or parts[0] not in ('countries', 'country') or \
+                parts[2] not in ('indicators', 'indicator'):
+            return json_response([{'message': [{'key': 'Invalid value'}]}], 400)
+        codes, indicators = parts[1], parts[3].split(';')
+        if not all(WORLD_BANK_INDICATOR_RE.match(indicator) for indicator in indicators):
+            return json_response(WORLD_BANK_INDICATOR_NOT_FOUND)
+        if codes.lower() == 'all':
+            countries = [
+                country for country in self.fixtures.countries
+                if country['iso3'] not in WORLD_BANK_UNKNOWN_ISO3
+            ]
+        else:
+            codes = {code.upper() for code in codes.split(';')}
+            countries = [
+                country for country in self.fixtures.countries
+                if country['iso3'] in codes or country['iso'].upper() in codes
+            ]
+            known = {
+                code
+                for country in countries if country['iso3'] not in WORLD_BANK_UNKNOWN_ISO3
+                for code in (country['iso3'], country['iso'].upper())
+            }
+            # One unknown code rejects the whole request
+            if codes - known:
+                return json_response(WORLD_BANK_INVALID_VALUE)
+        from_year, _, to_year = query.get('date', '2008:2018').partition(':')
+        years = list(range(int(to_year or from_year), int(from_year) - 1, -1))
+        records = [
+            {
+                'indicator': {'id': indicator, 'value': indicator},
+                'country': {'id': country['iso'].upper(), 'value': country['name']},
+                'countryiso3code': country['iso3'],
+                'date': str(year),
+                'value': self.fixtures.get_indicator_value(country['iso3'], indicator, year),
+                'unit': '',
+                'obs_status': '',
+                'decimal': 0,
+            }
+            for indicator in indicators
+            for country in countries
+            for year in years
+        ]
+        per_page = int(query.get('per_page', 50))
+        page = int(query.get('page', 1))
+        return json_response([
+            {
+                'page': page,
+                'pages': max((len(records) + per_page - 1) // per_page, 1),
+                'per_page': per_page,
+                'total': len(records),
+            },
+            get_page(records, (page - 1) * per_page, per_page),
+        ])
+
+    def climate(self, method, path, query, headers, body):
+        # /climateweb/rest/v1/country/mavg/<var>/<start>/<end>/<iso3>
+        parts = [part for part in path.split('/') if part]
+        if len(parts) != 9 or parts[3] != 'country' or parts[4] != 'mavg':
+            return json_response({'error': 'Invalid request'}, 400)
+        var, from_year, to_year, iso3 = parts[5:]
+        return json_response(
+            self.fixtures.get_climate(iso3.upper(), var, int(from_year), int(to_year))
+        )
+
+    def country_io(self, method, path, query, headers, body):
+        return json_response({
+            country['iso'].upper(): country['iso3'] for country in self.fixtures.countries
+        })
+
+
+def create_handler(api, latency, error_rate, seed):
+    rng = random.Random(seed)
+    rng_lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, *args):
+            pass
+
+        def respond(self, method):
+            body = self.rfile.read(int(self.headers.get('Content-Length') or 0))
+            if latency:
+                time.sleep(latency)
+            with rng_lock:
+                failed = rng.random() < error_rate
+            if failed:
+                status, headers, content = 503, {'Retry-After': '0'}, b'Service Unavailable'
+            else:
+                _, host, path = self.path.split('/', 2)
+                url = urlparse('/' + path)
+                query = {key: values[0] for key, values in parse_qs(url.query).items()}
+                status, headers, content = api.handle(
+                    method, host, url.path, query, self.headers, body,
+                )
+            self.send_response(status)
+            for header, value in headers.items():
+                self.send_header(header, value)
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+
+        def do_GET(self):
+            self.respond('GET')
+
+        def do_POST(self):
+            self.respond('POST')
+
+    return Handler
+
+
+def serve(scale, latency, error_rate, seed, queue):
+    api = FixtureApi(Fixtures(scale))
+    server = ThreadingHTTPServer(
+        ('127.0.0.1', 0), create_handler(api, latency, error_rate, seed),
+    )
+    server.daemon_threads = True
+    queue.put(server.server_address[1])
+    server.serve_forever()
+
+
+def start_server(scale=1, latency=0, error_rate=0, seed=0):
+    """
+    returns (server process, base url)
+    """
+    context = multiprocessing.get_context('spawn')
+    queue = context.Queue()
+    process = context.Process(
+        target=serve, args=(scale, latency, error_rate, seed, queue), daemon=True,
+    )
+    process.start()
+    return process, 'http://127.0.0.1:{}'.format(queue.get())
+
+
+if __name__ == '__main__':
+    # python -m benchmarks.server: serve 1x fixtures for manual runs
+    process, base_url = start_server()
+    print(json.dumps(get_host_rewrites(base_url), indent=2))
+    process.join()
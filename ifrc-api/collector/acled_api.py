@@ -1,17 +1,18 @@
 import json
-import requests
 import logging
-from os.path import join as path_join
+from os.path import join as path_join, splitext
 
 import pandas
 
 from .country import get_country_iso3
 from .config import NotTestException
 from .utils import dataframe_to_nested_dict
+from .storage import dump_table, load_table, remove_table
 from .common import (
     load_json_from_file, dump_json_to_file, get_file_created_iso_date,
     normal_to_camel_case
 )
+from .http_client import get_client
 
 logger = logging.getLogger(__name__)
 
@@ -21,74 +22,299 @@ Ref: https://www.acleddata.com/wp-content/uploads/2013/12/API-User-Guide-August-
 
 # ACLED_API_RAW = 'https://api.acleddata.com/acled/read'
 ACLED_API = 'https://api.acleddata.com/acled/read?limit=0&terms=accept'
+ACLED_READ_API = 'https://api.acleddata.com/acled/read?terms=accept'
+ACLED_PAGE_LIMIT = 5000
+# Only these fields are pulled and stored
+ACLED_FIELDS = ['data_id', 'iso3', 'year', 'event_date', 'event_type', 'timestamp']
+# Stored chunks are merged above this many chunks, into chunks of up to this many rows
+ACLED_MAX_CHUNKS = 20
+ACLED_CHUNK_ROWS = 100000
+
+
+class AcledStore():
+    """
+    Acled events stored as columnar tables (one chunk for each pulled page)
+        <path>/manifest.json: {
+            'last_timestamp': .., 'last_ids': [data_id with last_timestamp],
+            'next_chunk': .., 'chunks': [..], 'rows': {chunk: rows},
+            'superseded': {chunk: [data_id with a newer copy in a later chunk]},
+            'pending': [chunks not yet checked for superseded events],
+            'summarized': next_chunk when the summary was last saved,
+        }
+        <path>/<chunk>(.parquet|.json): see storage
+    Events updated upstream are pulled again, older copies are marked as
+    superseded (mark_superseded) and skipped by iter_chunks. Small chunks are
+    merged (compact) so their number stays bounded.
+    """
+    MANIFEST_FILENAME = 'manifest.json'
+
+    def __init__(self, path):
+        self.path = path
+        self.manifest_filename = path_join(path, AcledStore.MANIFEST_FILENAME)
+        try:
+            self.manifest = load_json_from_file(self.manifest_filename)
+        except (FileNotFoundError, json.decoder.JSONDecodeError):
+            self.manifest = {
+                'last_timestamp': None, 'last_ids': [], 'next_chunk': 0, 'chunks': [],
+            }
+        if 'pending' not in self.manifest:
+            # Stored before superseded events were tracked, check all the chunks
+            self.manifest.update(
+                rows={}, superseded={}, pending=list(self.manifest['chunks']),
+            )
+
+    def exists(self):
+        return len(self.manifest['chunks']) > 0
+
+    def save_manifest(self):
+        dump_json_to_file(self.manifest_filename, self.manifest)
+
+    def get_chunk_filename(self, chunk):
+        # splitext: chunks used to be named with .json
+        return path_join(self.path, splitext(chunk)[0])
+
+    def load_chunk(self, chunk, columns=ACLED_FIELDS):
+        dataframe = load_table(self.get_chunk_filename(chunk), columns=columns)
+        superseded = self.manifest['superseded'].get(chunk)
+        if superseded:
+            dataframe = dataframe[~dataframe['data_id'].isin(superseded)]
+        return dataframe
+
+    def get_rows(self, chunk):
+        if chunk not in self.manifest['rows']:
+            self.manifest['rows'][chunk] = len(self.load_chunk(chunk, columns=['data_id']))
+        return self.manifest['rows'][chunk]
+
+    def dump_chunk(self, dataframe):
+        chunk = '{:06d}'.format(self.manifest['next_chunk'])
+        dump_table(self.get_chunk_filename(chunk), dataframe)
+        self.manifest['next_chunk'] += 1
+        self.manifest['rows'][chunk] = len(dataframe)
+        return chunk
+
+    def append(self, events):
+        chunk = self.dump_chunk(pandas.DataFrame({
+            field: [event.get(field) for event in events]
+            for field in ACLED_FIELDS
+        }).drop_duplicates('data_id', keep='last'))
+        self.manifest['chunks'].append(chunk)
+        self.manifest['pending'].append(chunk)
+        self.save_manifest()
+
+    def mark_superseded(self):
+        """
+        Mark older copies of the events in pending chunks (only data_id is loaded)
+        """
+        pending = set(self.manifest['pending'])
+        if not pending:
+            return
+        seen = set()
+        for chunk in reversed(self.manifest['chunks']):
+            ids = self.load_chunk(chunk, columns=['data_id'])['data_id'].tolist()
+            superseded = seen.intersection(ids)
+            if superseded:
+                self.manifest['superseded'][chunk] = sorted(
+                    superseded.union(self.manifest['superseded'].get(chunk, []))
+                )
+                self.manifest['rows'][chunk] = len(ids) - len(superseded)
+            if chunk in pending:
+                seen.update(ids)
+        self.manifest['pending'] = []
+        self.save_manifest()
+
+    def compact(self):
+        """
+        Merge adjacent chunks (up to ACLED_CHUNK_ROWS rows) once there are more
+        than ACLED_MAX_CHUNKS, chunks are rewritten without superseded events
+        """
+        if len(self.manifest['chunks']) <= ACLED_MAX_CHUNKS or self.manifest['pending']:
+            return
+        print('Compacting Acled Data ({} chunks)'.format(len(self.manifest['chunks'])))
+        groups, group, rows = [], [], 0
+        for chunk in self.manifest['chunks']:
+            chunk_rows = self.get_rows(chunk)
+            if group and rows + chunk_rows > ACLED_CHUNK_ROWS:
+                groups.append(group)
+                group, rows = [], 0
+            group.append(chunk)
+            rows += chunk_rows
+        groups.append(group)
+
+        chunks, removed = [], []
+        for group in groups:
+            if len(group) == 1 and not self.manifest['superseded'].get(group[0]):
+                chunks.extend(group)
+                continue
+            chunks.append(self.dump_chunk(pandas.concat(
+                [self.load_chunk(chunk) for chunk in group], ignore_index=True,
+            )))
+            removed.extend(group)
+        self.manifest['chunks'] = chunks
+        for chunk in removed:
+            self.manifest['rows'].pop(chunk, None)
+            self.manifest['superseded'].pop(chunk, None)
+        # Old chunks are removed only after the manifest points to the merged ones
+        self.save_manifest()
+        for chunk in removed:
+            remove_table(self.get_chunk_filename(chunk))
+
+    def iter_chunks(self):
+        """
+        Events chunk by chunk (without superseded copies)
+        """
+        for chunk in self.manifest['chunks']:
+            yield self.load_chunk(chunk)
+
+    def is_summarized(self):
+        """
+        True if the summary was saved after the last change of the stored events
+        """
+        return self.manifest.get('summarized') == self.manifest['next_chunk']
+
+    def set_summarized(self):
+        self.manifest['summarized'] = self.manifest['next_chunk']
+        self.save_manifest()
+
+    def get_updated_dt(self):
+        return get_file_created_iso_date(self.manifest_filename)
 
 
 class AcledApi():
-    DATA_FILENAME = 'data.json'
+    EVENTS_DIRNAME = 'events'
     SUMMARY_FILENAME = 'summary.json'
 
     def __init__(self, path, test=False):
-        self.data = None
         self.summary = None
 
-        self.data_filename = path_join(path, AcledApi.DATA_FILENAME)
+        self.store = AcledStore(path_join(path, AcledApi.EVENTS_DIRNAME))
         self.summary_filename = path_join(path, AcledApi.SUMMARY_FILENAME)
 
         try:
             if not test:
                 raise NotTestException
-            self.data = load_json_from_file(self.data_filename)
+            if not self.store.exists() or not self.store.is_summarized():
+                raise FileNotFoundError
             self.summary = load_json_from_file(self.summary_filename)
             print('Using Local Acled Data')
         except (
                 TypeError, FileNotFoundError, json.decoder.JSONDecodeError,
                 NotTestException,
-        )\
-                as e:
-            self.load_data(path)
+        ):
+            self.load_data(path, pull=not (test and self.store.exists()))
 
-    def load_data(self, path):
-        if not self.data:
+    def load_data(self, path, pull=True):
+        if pull:
             print('Pulling Acled Data')
-            response = requests.get(ACLED_API)
-            self.data = response.json()['data']
-            dump_json_to_file(self.data_filename, self.data)
+            # Summary is also re-calculated if the last run died before saving it
+            if self.pull() == 0 and self.summary is None and self.store.is_summarized():
+                try:
+                    self.summary = load_json_from_file(self.summary_filename)
+                    print('No new Acled Data')
+                    return
+                except (FileNotFoundError, json.decoder.JSONDecodeError):
+                    pass
         print('Re-calculating Acled Data')
-        self.summary = {
-            'average': AcledApi.get_summary(self.data),
-            'all': AcledApi.get_summary_with_type(self.data)
-        }
+        # Chunk by chunk, only one chunk of events is in memory at once
+        self.summary = AcledApi.get_summaries(self.store.iter_chunks())
         dump_json_to_file(self.summary_filename, self.summary)
+        self.store.set_summarized()
+
+    def pull(self):
+        """
+        Pull events page by page into the store
+        Only events updated since the last pull are pulled if store exists
+        returns number of pulled events
+        """
+        last_timestamp = self.store.manifest['last_timestamp']
+        # Already stored events with last_timestamp
+        last_ids = set(self.store.manifest['last_ids'])
+        params = {'fields': '|'.join(ACLED_FIELDS), 'limit': ACLED_PAGE_LIMIT}
+        if last_timestamp is not None:
+            params.update(timestamp=last_timestamp, timestamp_where='>=')
+
+        page, pulled = 1, 0
+        new_timestamp, new_ids = last_timestamp or 0, set(last_ids)
+        while True:
+            response = get_client().get(ACLED_READ_API, params=dict(params, page=page))
+            data = response.json()
+            # Errors are returned as {'success': false, 'error': ..} (no data)
+            if not isinstance(data, dict) or 'data' not in data:
+                raise Exception('Acled pull failed: {}'.format(
+                    data.get('error') if isinstance(data, dict) else data
+                ))
+            page_events = data['data'] or []
+            events = [
+                event for event in page_events
+                if not (
+                    int(event['timestamp']) == last_timestamp and
+                    event['data_id'] in last_ids
+                )
+            ]
+            if events:
+                self.store.append(events)
+                pulled += len(events)
+            for event in events:
+                timestamp = int(event['timestamp'])
+                if timestamp > new_timestamp:
+                    new_timestamp, new_ids = timestamp, set()
+                if timestamp == new_timestamp:
+                    new_ids.add(event['data_id'])
+            if len(page_events) < ACLED_PAGE_LIMIT:
+                break
+            page += 1
+
+        # Only set after all the pages are pulled (pages aren't ordered by timestamp)
+        if pulled:
+            self.store.manifest['last_timestamp'] = new_timestamp
+            self.store.manifest['last_ids'] = sorted(new_ids)
+            self.store.save_manifest()
+        self.store.mark_superseded()
+        self.store.compact()
+        return pulled
 
     def get_data_pulled_dt(self):
-        return get_file_created_iso_date(self.data_filename)
+        return self.store.get_updated_dt()
 
     @staticmethod
-    def get_summary(data):
-        summary = {}
-        dataframe = pandas.DataFrame(data)
+    def get_counts(dataframe):
+        """
+        # of events by iso3, year, event type, YYYY-MM
+        """
         dataframe = dataframe[dataframe.event_date >= '2008-01-01']
-        op = dataframe.groupby(
-            ['iso3', 'year']
-        ).agg({'data_id': 'count'})
-        summary = dataframe_to_nested_dict(op)
-        return summary
+        event_types = dataframe.event_type.fillna('')
+        # Only the distinct event types are converted
+        event_type_map = {
+            event_type: normal_to_camel_case(event_type)
+            for event_type in event_types.unique()
+        }
+        return pandas.DataFrame({
+            'iso3': dataframe.iso3,
+            'year': dataframe.year,
+            'event_type': event_types.map(event_type_map),
+            'month': dataframe.event_date.str[:7],
+        }).groupby(['iso3', 'year', 'event_type', 'month']).size()
 
     @staticmethod
-    def get_summary_with_type(data):
-        def get_event_type(index):
-            return normal_to_camel_case(data[index].get('event_type'))
-
-        def get_month(index):
-            return data[index].get('event_date')[:7]
-
-        dataframe = pandas.DataFrame(data)
-        dataframe = dataframe[dataframe.event_date >= '2008-01-01']
-        op = dataframe.groupby(
-            ['iso3', get_event_type, get_month]
-        ).agg({'data_id': 'count'})
-        summary = dataframe_to_nested_dict(op)
-        return summary
+    def get_summaries(dataframes):
+        """
+        Both summaries from the counts of each dataframe (chunk)
+            average: iso3 -> year -> count
+            all: iso3 -> eventType -> YYYY-MM -> count
+        """
+        counts = [AcledApi.get_counts(dataframe) for dataframe in dataframes] or [
+            AcledApi.get_counts(pandas.DataFrame(columns=ACLED_FIELDS))
+        ]
+        counts = pandas.concat(counts).groupby(
+            level=['iso3', 'year', 'event_type', 'month'],
+        ).sum()
+        return {
+            'average': dataframe_to_nested_dict(
+                counts.groupby(level=['iso3', 'year']).sum().to_frame()
+            ),
+            'all': dataframe_to_nested_dict(
+                counts.groupby(level=['iso3', 'event_type', 'month']).sum().to_frame()
+            ),
+        }
 
     def get_num_of_reported_conflict_events_pull(self, country_iso, year):
         data = self.summary['average'].get(
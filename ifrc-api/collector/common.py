@@ -2,19 +2,17 @@ import re
 import os
 import pickle
 import base64
-import requests
 import csv
 import json
-import aiohttp
-import asyncio
 from datetime import datetime, timezone, timedelta, date as datetime_date
 from dateutil.relativedelta import relativedelta
 
 from .config import settings
+from .http_client import Response, get_client
+from .metrics import metrics
 
 
 datetime_now = datetime.now()
-HEADERS = {'user-agent': 'Mozilla/5.0 (X11; Linux x86_64; rv:63.0) Gecko/20100101 Firefox/63.0'}
 
 
 def normal_to_camel_case(name=''):
@@ -97,11 +95,11 @@ def load_pickle_from_file(filename):
     return data
 
 
-def dump_url_to_file(url, filename):
-    response = requests.get(url, allow_redirects=True)
-    os.makedirs(os.path.dirname(filename), exist_ok=True)
-    with open(filename, 'wb') as fp:
-        fp.write(response.content)
+def dump_url_to_file(url, filename, headers=None):
+    """
+    Stream url to filename, returns response (without content)
+    """
+    return get_client().download(url, filename, headers=headers)
 
 
 def dump_json_to_file(filename, data):
@@ -138,82 +136,60 @@ def seconds_to_human_readable(seconds):
     return str(sec)
 
 
-async def r_fetch(session, url, headers, return_param=None, exception_handler=None):
-    async with session.get(url, headers=headers) as response:
-        try:
-            return {
-                'json': await response.json(),
-                'url': str(response.url),
-                'status': response.status,
-            }, return_param
-        except Exception as e:
-            if exception_handler is not None:
-                exception_handler(response, e)
-
-
-async def r_post(session, url, param, return_param=None, exception_handler=None):
-    async with session.post(url, data=json.dumps(param)) as response:
-        try:
-            return {
-                'json': await response.json(),
-                'url': str(response.url),
-                'status': response.status,
-            }, return_param
-        except Exception as e:
-            if exception_handler is not None:
-                exception_handler(response, e)
-
-
-async def _async_fetch(url_with_params, headers, exception_handler):
-    tasks = []
-    async with aiohttp.ClientSession() as session:
-        for url, return_params in url_with_params:
-            task = asyncio.ensure_future(
-                r_fetch(session, url, headers, return_params, exception_handler)
-            )
-            tasks.append(task)
-        responses = await asyncio.gather(*tasks)
-        return responses
-
-
-async def _async_post(urls_with_params, limit_per_host=5, exception_handler=None):
-    conn = aiohttp.TCPConnector(limit_per_host=limit_per_host)
-    tasks = []
-    async with aiohttp.ClientSession(headers=HEADERS, connector=conn) as session:
-        for url, param, return_params in urls_with_params:
-            task = asyncio.ensure_future(
-                r_post(session, url, param, return_params, exception_handler)
-            )
-            tasks.append(task)
-        responses = await asyncio.gather(*tasks)
-        return responses
+def to_fetch_result(url, response, return_param=None, exception_handler=None):
+    if isinstance(response, Exception):
+        # Request failed even after retries
+        if exception_handler is not None:
+            exception_handler(Response(url, None, {}, b''), response)
+        return None, return_param
+    try:
+        return {
+            'json': response.json(),
+            'url': response.url,
+            'status': response.status,
+        }, return_param
+    except Exception as e:
+        if exception_handler is not None:
+            exception_handler(response, e)
+        return {
+            'json': None,
+            'url': response.url,
+            'status': response.status,
+        }, return_param
 
 
 def async_fetch(url_with_params, headers=None, exception_handler=None):
-    loop = asyncio.get_event_loop()
-    future = asyncio.ensure_future(
-        _async_fetch(url_with_params, headers, exception_handler)
-    )
-    return loop.run_until_complete(future)
-
-
-def async_post(urls_with_params, limit_per_host=None, exception_handler=None):
-    loop = asyncio.get_event_loop()
-    future = asyncio.ensure_future(
-        _async_post(urls_with_params, limit_per_host, exception_handler)
-    )
-    return loop.run_until_complete(future)
+    with metrics.timer('fetch', 'async_fetch'):
+        responses = get_client().gather([
+            {'method': 'GET', 'url': url, 'headers': headers}
+            for url, _ in url_with_params
+        ])
+    return [
+        to_fetch_result(url, response, return_param, exception_handler)
+        for response, (url, return_param) in zip(responses, url_with_params)
+    ]
+
+
+def async_post(urls_with_params, exception_handler=None):
+    with metrics.timer('fetch', 'async_post'):
+        responses = get_client().gather([
+            {'method': 'POST', 'url': url, 'data': json.dumps(param)}
+            for url, param, _ in urls_with_params
+        ])
+    return [
+        to_fetch_result(url, response, return_param, exception_handler)
+        for response, (url, _, return_param) in zip(responses, urls_with_params)
+    ]
 
 
 def sync_fetch(urls, headers=None, exception_handler=None):
+    client = get_client()
     for url in urls:
         try:
-            response = requests.get(url, headers=headers)
-            yield {
-                'json': response.json(),
-                'url': str(response.url),
-                'status': response.status_code,
-            }
+            with metrics.timer('fetch', 'sync_fetch'):
+                response = client.get(url, headers=headers)
         except Exception as e:
-            if exception_handler is not None:
-                exception_handler(response, e)
+            response = e
+        result, _ = to_fetch_result(url, response, exception_handler=exception_handler)
+        if result is not None and result['json'] is not None:
+            yield result
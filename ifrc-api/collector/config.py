@@ -6,15 +6,78 @@ class settings():
     output_dir = '.cache'
 
 
+class HttpSettings():
+    # Connections shared by the whole run
+    pool_size = 100
+    # Seconds to wait for connect/read (not for the whole response)
+    timeout = 120
+    retries = 5
+    # Seconds, doubled on every retry
+    backoff = 1
+    # Seconds, upper bound for the retry delay (including server Retry-After)
+    max_retry_delay = 60
+    retry_status = (429, 500, 502, 503, 504)
+    # host: (concurrent requests, requests per second, burst)
+    default_host_limit = (10, 10, 10)
+    host_limits = {
+        # reliefweb
+        'api.reliefweb.int': (5, 5, 5),
+        # go
+        'prddsgocdnapi.azureedge.net': (5, 10, 10),
+        'dsgocdnapi.azureedge.net': (5, 10, 10),
+        # hpc/fts
+        'api.hpc.tools': (5, 5, 5),
+        # world bank
+        'api.worldbank.org': (10, 10, 10),
+        'climatedataapi.worldbank.org': (10, 10, 10),
+        # acled
+        'api.acleddata.com': (2, 2, 2),
+    }
+    # scheme://host: base url to send its requests to instead (e.g. benchmark fixtures)
+    # limits and cache still use the original host
+    host_rewrites = {}
+
+
+class HttpCacheSettings():
+    # Bytes, least recently used responses are evicted above this
+    max_size = 2 * 1024 ** 3
+    # Seconds, 0 to disable cache
+    default_ttl = 0
+    ttl = {
+        'api.reliefweb.int': 24 * 3600,
+        'prddsgocdnapi.azureedge.net': 24 * 3600,
+        'dsgocdnapi.azureedge.net': 24 * 3600,
+        'api.hpc.tools': 24 * 3600,
+        'api.worldbank.org': 7 * 24 * 3600,
+        'climatedataapi.worldbank.org': 30 * 24 * 3600,
+        'country.io': 30 * 24 * 3600,
+        # acled and startnetwork keep their own raw data cache
+    }
+
+
+class WorldBankSettings():
+    # Indicator codes pulled for every country (https://data.worldbank.org/indicator)
+    indicators = [
+        'SP.POP.TOTL',  # Population, total (also used for the population block)
+        'SP.URB.TOTL.IN.ZS',  # Urban population (% of total)
+        'NY.GDP.PCAP.CD',  # GDP per capita (current US$)
+        'SI.POV.DDAY',  # Poverty headcount ratio at $1.90 a day (% of population)
+        'SP.DYN.LE00.IN',  # Life expectancy at birth (years)
+        'SH.DYN.MORT',  # Mortality rate, under-5 (per 1,000 live births)
+    ]
+
+
 class Units():
     count = 'count'
     average = 'average'
+    millimeter = 'mm'
 
 
 class Sources():
     reliefWeb = 'reliefweb'
     acled = 'acled'
     go_api = 'prddsgocdnapi.azureedge.net'
+    climate = 'climatedataapi.worldbank.org'
 
 
 class Strings():
@@ -1,25 +1,33 @@
+import os
+import re
 import pycountry
-import requests
 import json
 import logging
+from types import MappingProxyType
+from functools import lru_cache
 
 from .common import gen_output_path, dump_json_to_file, load_json_from_file
+from .http_client import get_client
 
 logger = logging.getLogger(__name__)
 
 COUNTRY_ISO3_API = 'http://country.io/iso3.json'
 COUNTRY_API = 'http://dsgocdnapi.azureedge.net/api/v2/country/?limit=300'
 
+# Snapshot of COUNTRY_ISO3_API shipped with the package
+COUNTRY_ISO3_BUNDLED_FILENAME = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), 'data', 'country_iso3.json',
+)
+COUNTRY_ISO3_FILENAME = 'country_iso3.json'
+COUNTRY_FILENAME = 'country.json'
 
 """
+Country data is loaded on first use (no network on import)
+Refresh cached data with: python -m collector.country
+
 iso2 -> iso3 {'BD': 'BGD', 'BE': 'BEL', 'BF': 'BFA', 'BG': 'BGR', ...}
 iso3 -> iso2 {'BGD': 'BD', 'BEL': 'BE', 'BFA': 'BF', 'BGR': 'BG', ...}
 """
-country_iso3 = requests.get(COUNTRY_ISO3_API).json()
-country_iso3['AN'] = 'ANT'
-country_iso3['CS'] = 'SCG'
-
-country_iso2 = {country_iso3[iso3]: iso3 for iso3 in country_iso3}
 
 missed_country = {
     'cape verde': 'CPV',
@@ -31,42 +39,114 @@ missed_country = {
 }
 
 
+@lru_cache(maxsize=None)
+def get_country_iso3_map():
+    """
+    iso2 -> iso3, refreshed copy (if any) is used over the bundled one
+    """
+    try:
+        country_iso3 = load_json_from_file(gen_output_path(COUNTRY_ISO3_FILENAME))
+    except (FileNotFoundError, json.decoder.JSONDecodeError):
+        country_iso3 = load_json_from_file(COUNTRY_ISO3_BUNDLED_FILENAME)
+    country_iso3['AN'] = 'ANT'
+    country_iso3['CS'] = 'SCG'
+    return MappingProxyType(country_iso3)
+
+
+@lru_cache(maxsize=None)
+def get_country_iso2_map():
+    """
+    iso3 -> iso2
+    """
+    country_iso3 = get_country_iso3_map()
+    return MappingProxyType({country_iso3[iso2]: iso2 for iso2 in country_iso3})
+
+
+def normalize_name(name):
+    """
+    'Congo, The Democratic Republic of the' -> 'congo the democratic republic of the'
+    """
+    return ' '.join(re.sub(r'[^\w]+', ' ', name.lower()).split())
+
+
 def get_country_from_name(name):
     try:
-        return pycountry.countries.get(name=name)
-    except KeyError:
-        try:
-            return pycountry.countries.lookup(name)
-        except LookupError:
-            return pycountry.countries.get(
-                alpha_3=missed_country[name.lower()]
-            )
+        return pycountry.countries.lookup(name)
+    except LookupError:
+        return None
+
+
+class CountryIndex():
+    """
+    Read only hashed lookups for GO countries and ISO codes
+
+    countries: GO countries (same order as the GO api)
+    iso2, iso3: GO countries iso codes
+    by_id, by_iso2, by_iso3: GO country
+    iso2_to_iso3, iso3_to_iso2: all known iso codes
+    names: normalized name -> iso3 (pycountry, GO and missed_country names)
+    """
+    __slots__ = (
+        'countries', 'iso2', 'iso3', 'by_id', 'by_iso2', 'by_iso3',
+        'iso2_to_iso3', 'iso3_to_iso2', 'names', 'resolve_name',
+    )
+
+    def __init__(self, countries, country_iso3, country_iso2):
+        names = {}
+        for country in pycountry.countries:
+            for field in ['alpha_2', 'alpha_3', 'name', 'official_name', 'common_name']:
+                if getattr(country, field, None):
+                    names[normalize_name(getattr(country, field))] = country.alpha_3
+        for country in countries:
+            if country.get('name') and country.get('iso3'):
+                names.setdefault(normalize_name(country['name']), country['iso3'])
+        for name, iso3 in missed_country.items():
+            names[normalize_name(name)] = iso3
+
+        for field, value in {
+                'countries': tuple(countries),
+                'iso2': frozenset(country['iso'] for country in countries),
+                'iso3': frozenset(country['iso3'] for country in countries),
+                'by_id': MappingProxyType({country['id']: country for country in countries}),
+                'by_iso2': MappingProxyType({country['iso']: country for country in countries}),
+                'by_iso3': MappingProxyType({country['iso3']: country for country in countries}),
+                'iso2_to_iso3': country_iso3,
+                'iso3_to_iso2': country_iso2,
+                'names': MappingProxyType(names),
+                # Memoized, same names are resolved once
+                'resolve_name': lru_cache(maxsize=None)(self._resolve_name),
+        }.items():
+            object.__setattr__(self, field, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('CountryIndex is read only')
+
+    def _resolve_name(self, name):
+        """
+        name -> iso3 (None if not resolved)
+        """
+        iso3 = self.names.get(normalize_name(name))
+        if iso3 is None:
+            country = get_country_from_name(name)
+            iso3 = country and country.alpha_3
+        return iso3
 
 
 def get_country_iso2(iso='', name=None):
     if name:
-        try:
-            return get_country_from_name(name).alpha_2
-        except KeyError:
-            return country_iso3.get(missed_country[name.lower()])
+        iso3 = get_country_index().resolve_name(name)
+        return iso3 and get_country_iso2_map().get(iso3)
     if iso and len(iso) == 3:
-        return country_iso2.get(iso.upper())
-        # return pycountry.countries.get(alpha_3=iso.upper()).alpha_2
+        return get_country_iso2_map().get(iso.upper())
     return iso
-    # return pycountry.countries.get(alpha_3=iso.upper()).alpha_2
 
 
 def get_country_iso3(iso='', name=None):
     if name:
-        try:
-            return get_country_from_name(name).alpha_3
-        except KeyError:
-            return missed_country[name.lower()]
+        return get_country_index().resolve_name(name)
     if iso and len(iso) == 2:
-        return country_iso3.get(iso.upper())
-        # return pycountry.countries.get(alpha_2=iso.upper()).alpha_3
+        return get_country_iso3_map().get(iso.upper())
     return iso
-    # return pycountry.countries.get(alpha_2=iso.upper()).alpha_3
 
 
 def map_data(country_info):
@@ -98,7 +178,7 @@ class CountryApi():
     def pull(self):
         print('Pulling Country Data')
         countries = []
-        response = requests.get(COUNTRY_API)
+        response = get_client().get(COUNTRY_API)
         data = response.json().get('results', [])
         for country_data in data:
             country = map_data(country_data)
@@ -117,17 +197,59 @@ class CountryApi():
         return self.countries
 
 
+@lru_cache(maxsize=None)
+def get_country_api():
+    return CountryApi(gen_output_path(COUNTRY_FILENAME))
+
+
+@lru_cache(maxsize=None)
+def get_country_index():
+    return CountryIndex(
+        get_country_api().get_countries(), get_country_iso3_map(), get_country_iso2_map(),
+    )
+
+
+def get_countries():
+    return get_country_index().countries
+
+
+def get_countries_iso2():
+    return [country['iso'] for country in get_countries()]
+
+
+def get_countries_iso3():
+    return [country['iso3'] for country in get_countries()]
+
+
+def get_country_by_id(country_id):
+    return get_country_index().by_id.get(country_id)
+
+
+def in_countries_iso2(iso2=''):
+    return iso2.upper() in get_country_index().iso2
+
+
+def in_countries_iso3(iso3=''):
+    return iso3.upper() in get_country_index().iso3
+
+
+def refresh():
+    """
+    Pull latest country data and replace the cached ones
+    """
+    print('Pulling Country ISO Data')
+    country_iso3 = get_client().get(COUNTRY_ISO3_API).json()
+    dump_json_to_file(gen_output_path(COUNTRY_ISO3_FILENAME), country_iso3)
+    get_country_iso3_map.cache_clear()
+    get_country_iso2_map.cache_clear()
+
+    country_api = CountryApi()
+    country_api.save(gen_output_path(COUNTRY_FILENAME))
+    get_country_api.cache_clear()
+    get_country_index.cache_clear()
+    return country_api.get_countries()
+
+
 if __name__ == '__main__':
-    countries = CountryApi(gen_output_path('country.json'))
-    print(json.dumps(countries))
-else:
-    country_api = CountryApi(gen_output_path('country.json'))
-    countries = country_api.get_countries()
-    countries_iso2 = country_api.get_countries_iso(iso2=True)
-    countries_iso3 = country_api.get_countries_iso()
-
-    def in_countries_iso2(iso2=''):
-        return iso2.upper() in countries_iso2
-
-    def in_countries_iso3(iso3=''):
-        return iso3.upper() in countries_iso3
+    countries = refresh()
+    print('{} countries saved'.format(len(countries)))
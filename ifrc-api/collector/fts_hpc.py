@@ -26,19 +26,19 @@ run with:
         r
 """
 
-import re
 import json
-from pandas.io.json import json_normalize
-import dateparser
 import traceback
 
-from .country import get_country_iso3, countries_iso3
-from .common import sync_fetch, base64_encode
+import pandas
+
+from .country import get_country_iso3, get_countries_iso3
+from .common import async_fetch, base64_encode
 
 
 API_END_POINT = 'https://api.hpc.tools/v1/public'
 FTS_URL = API_END_POINT + '/fts/flow?countryISO3={0}&groupby=year&report=3'
 EMERGENCY_URL = API_END_POINT + '/emergency/country/{0}'
+FUND_AREAS = ['fundingTotals', 'pledgeTotals']
 
 
 def request_exception_handler(request, exception):
@@ -47,9 +47,9 @@ def request_exception_handler(request, exception):
     print(exception)
 
 
-def api_pull(urls, headers):
-    """pull down API contents, and use local history if testing
-         urls: list of URLS to pull response from
+def api_pull(urls_with_params, headers):
+    """pull down API contents concurrently (limited per host by http client)
+         urls_with_params: list of (url, return_param)
 
         results yield the following:
             Sum of incoming flows grouped by the specified source object type
@@ -61,44 +61,73 @@ def api_pull(urls, headers):
             Sum of outgoing flows grouped by destination objects
 
         we want the ***'d one (report 3)
-    TODO: Use asyncio
-        https://pawelmhm.github.io/asyncio/python/aiohttp/2016/04/22/asyncio-aiohttp.html
-    """
-    if type(urls) != list:
-        urls = [urls]
-
-    # print('1st pulling for : ' + str(urls[0]))
 
-    resps = sync_fetch(
-        urls,
+        returns list of (json, return_param) for good responses
+    """
+    resps = async_fetch(
+        urls_with_params,
         headers=headers,
         exception_handler=request_exception_handler
     )
-    """
-    resps = []
-    resps += grequests.map(
-        rs, exception_handler=request_exception_handler, size=25
-    )
-    # rs = (grequests.get(ref) for ref in urls)
-    """
-
-    # print('reqs mapped')
 
     good_resps = []
     bad_resps = []
-    for r in resps:
-        load = r['json']
-        load['url'] = str(r['url'])
-        if r['status'] == 200:
-            good_resps.append(load)
+    for r, return_param in resps:
+        if r is not None and r['status'] == 200 and r['json'] is not None:
+            good_resps.append((r['json'], return_param))
         else:
-            bad_resps.append(load)
+            bad_resps.append(return_param)
 
     # print('pulled. num bad resps: ' + str(len(bad_resps)))
 
     return good_resps
 
 
+def parse_funds(load):
+    """
+    Only keep total funding by year for each fund area
+    """
+    funds = {}
+    for fund_area in FUND_AREAS:
+        data = load['data']['report3'][fund_area]['objects']
+        if len(data) == 0:
+            continue
+        for v in data[0]['objectsBreakdown']:
+            try:
+                year = int(v['name'])
+            except ValueError:
+                traceback.print_exc()
+                continue
+            funds.setdefault(year, {})[fund_area] = v['totalFunding']
+    return funds
+
+
+def parse_evt_dates(load):
+    """
+    Only keep emergencies date
+    """
+    return [emergency.get('date') for emergency in load['data']]
+
+
+def count_evt_by_year(evt_dates):
+    """
+    evt_dates: {iso3: [date, ...]}
+    returns: {iso3: {year: count}} (empty dict for countries without emergency)
+    """
+    ret_d = {iso: {} for iso in evt_dates}
+    dataframe = pandas.DataFrame(
+        [(iso, date) for iso, dates in evt_dates.items() for date in dates],
+        columns=['iso3', 'date'],
+    )
+    # Year as written in the (ISO 8601) date, not converted to UTC
+    # Dates without a leading year are dropped
+    dataframe['year'] = dataframe['date'].str.extract(r'^(\d{4})', expand=False)
+    dataframe = dataframe.dropna(subset=['year'])
+    for (iso, year), count in dataframe.groupby(['iso3', 'year']).size().items():
+        ret_d[iso][int(year)] = int(count)
+    return ret_d
+
+
 class FTS(object):
     def __init__(self, hpc_credential, test=None):
         """
@@ -114,82 +143,57 @@ class FTS(object):
     def get_urls(self, url):
         """
         iterate through cnts to get base URLs for sending to API in bulk
-
+        returns list of (url, iso3)
         """
-        urls = [url.format(v) for v in countries_iso3]
+        urls = [(url.format(v), v) for v in get_countries_iso3()]
 
         if self.test:
             return urls[:1]
         else:
             return urls
 
+    def pull(self, urls):
+        """
+        pull both funds and emergency counts concurrently
+        urls: list of api url (FTS_URL, EMERGENCY_URL)
+        returns: {url: {iso3: data}}
+        """
+        ret_d = {url: {} for url in urls}
+        urls_with_params = [
+            (country_url, (url, iso))
+            for url in urls
+            for country_url, iso in self.get_urls(url)
+        ]
+        for load, (url, iso) in api_pull(urls_with_params, self.headers):
+            if url == FTS_URL:
+                ret_d[url][iso] = parse_funds(load)
+            else:
+                ret_d[url][iso] = parse_evt_dates(load)
+        if EMERGENCY_URL in ret_d:
+            ret_d[EMERGENCY_URL] = count_evt_by_year(ret_d[EMERGENCY_URL])
+        return ret_d
+
     def pull_funds(self):
         """
         go through URL list and pull needed info on total, pledged funding
         and total count
         """
-        ret_d = {}
-
-        urls = self.get_urls(FTS_URL)
-
-        for cnt_vals in api_pull(urls, self.headers):
-
-            # here we pull the ISO from the URL; we could have gotten this
-            # at the api_pull, but #yolo (and it'd take some refactoring)
-            iso = re.search('ISO3=([A-Z]{3})', cnt_vals['url']).group(1)
-            ret_d[iso] = {}
-
-            for fund_area in ['fundingTotals', 'pledgeTotals']:
-                data = cnt_vals['data']['report3'][fund_area]['objects']
-                if len(data) > 0:
-                    for v in data[0]['objectsBreakdown']:
-                        try:
-                            year = int(v['name'])
-                        except ValueError:
-                            traceback.print_exc()
-                            continue
-                        if year not in ret_d[iso]:
-                            ret_d[iso][year] = {fund_area: v['totalFunding']}
-
-                    ret_d[iso][year][fund_area] = v['totalFunding']
-
-        return ret_d
+        return self.pull([FTS_URL])[FTS_URL]
 
     def pull_evt_cnts(self):
         """
         go through URL list and pull needed info on counts by country and year
         """
-        urls = self.get_urls(EMERGENCY_URL)
-        ret_d = {}
-
-        for v in api_pull(urls, self.headers):
-            iso = iso = re.search('([A-Z]{3})$', v['url']).group(1)
-            if iso in ret_d:
-                print('Duplicate iso {}'.format(iso))
-            ret_d[iso] = {}
-
-            # extract years and group by them
-            r = json_normalize(v['data']).apply(
-                lambda x: dateparser.parse(x.date).year, axis=1
-            )
-            try:
-                s = r.groupby(r).size()
-            except ValueError:  # Raised if v['data'] is empty array
-                pass
-
-            for v in s.iteritems():
-                # item 0: year, 1: count
-                ret_d[iso][v[0]] = v[1]
-
-        return ret_d
+        return self.pull([EMERGENCY_URL])[EMERGENCY_URL]
 
     def merge(self):
         """
         join counts and funding amts by building on funds dict
         """
         print('Pulling FTS Data')
-        funds = self.pull_funds()
-        cnts = self.pull_evt_cnts()
+        data = self.pull([FTS_URL, EMERGENCY_URL])
+        funds = data[FTS_URL]
+        cnts = data[EMERGENCY_URL]
 
         # k: country, v: values
         for country, values in cnts.items():
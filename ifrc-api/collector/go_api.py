@@ -1,15 +1,19 @@
 import json
-import requests
-import traceback
+import time
+import shutil
+import asyncio
+from functools import lru_cache
 from os.path import join as path_join
-from dateutil import parser as datetime_parser
 
 from .config import GoApiFields as _ts, NotTestException
+import pandas
+
 from .common import (
-    dump_json_to_file, load_json_from_file,
-    get_year_month_formatted, gen_output_path,
+    gen_output_path, load_json_from_file, dump_json_to_file,
     load_pickle_from_file, dump_pickle_to_file, snakecase_to_camelCase
 )
+from .storage import dump_table, load_table, table_exists, table_to_records
+from .http_client import get_client
 # from utils import add_country_meta
 
 """
@@ -21,6 +25,11 @@ atype:
 API_ENDPOINT = 'https://prddsgocdnapi.azureedge.net/api/v2'
 APPEL_URL = API_ENDPOINT + '/appeal/'
 DISASTER_TYPE_URL = API_ENDPOINT + '/disaster_type/'
+GO_PAGE_LIMIT = 500
+# Failed pages are pulled again up to this many times
+GO_PAGE_ROUNDS = 3
+# Stored pages older than this (seconds) are not reused (amounts are edited upstream)
+GO_PAGES_MAX_AGE = 6 * 60 * 60
 
 ATYPE = {
     0: 'DREF',
@@ -58,8 +67,20 @@ def normalize(data):
     return _data
 
 
+def get_id(data):
+    """
+    {'id': 1, ...} -> 1 (None if not provided)
+    """
+    if isinstance(data, dict) and data.get('id') is not None:
+        return int(data['id'])
+
+
+@lru_cache(maxsize=None)
 def get_disaster_types():
-    response = requests.get(DISASTER_TYPE_URL)
+    """
+    Pulled once per run
+    """
+    response = get_client().get(DISASTER_TYPE_URL)
     return {
         disaster['id']: disaster['name']
         for disaster in response.json()['results']
@@ -67,26 +88,97 @@ def get_disaster_types():
 
 
 def get_disasters_id():
-    response = requests.get(DISASTER_TYPE_URL)
-    results = response.json().get('results')
-    return [disasters.get('id') for disasters in results]
+    return list(get_disaster_types().keys())
 
 
-def go_api_appeal_full_data(params={}):
-    params['limit'] = 1
-    response = requests.get(APPEL_URL, params=params)
-    params['limit'] = response.json().get('count')
-    response = requests.get(APPEL_URL, params=params)
-    return response.json()
+def get_page_filename(path, offset):
+    return path_join(path, '{:08d}.json'.format(offset))
+
+
+def pull_appeals(params=None, path=None):
+    """
+    Pull all appeals (filtered by params) as concurrent page requests
+    path: pages are stored here as they arrive, stored pages are not pulled
+        again (resume after a failed pull) while the appeal count is unchanged
+        and they are not older than GO_PAGES_MAX_AGE
+    returns appeals ordered by id
+    """
+    client = get_client()
+    params = dict(params or {}, ordering='id')
+    count = client.get(
+        APPEL_URL, params=dict(params, limit=1), use_cache=False,
+    ).json()['count']
+    offsets = list(range(0, count, GO_PAGE_LIMIT))
+
+    pages = {}
+    if path is not None:
+        manifest = {'count': count, 'limit': GO_PAGE_LIMIT, 'params': params}
+        manifest_filename = path_join(path, 'manifest.json')
+        try:
+            stored = load_json_from_file(manifest_filename)
+            created = stored.pop('created', 0)
+            if stored != manifest or time.time() - created > GO_PAGES_MAX_AGE:
+                raise FileNotFoundError()
+            for offset in offsets:
+                try:
+                    pages[offset] = load_json_from_file(get_page_filename(path, offset))
+                except (FileNotFoundError, json.decoder.JSONDecodeError):
+                    pass
+            if pages:
+                print('Resuming Go Api Data ({}/{} pages)'.format(len(pages), len(offsets)))
+        except (FileNotFoundError, json.decoder.JSONDecodeError):
+            shutil.rmtree(path, ignore_errors=True)
+            dump_json_to_file(manifest_filename, dict(manifest, created=time.time()))
+
+    async def pull_page(offset):
+        response = await client.request(
+            'GET', APPEL_URL, params=dict(params, limit=GO_PAGE_LIMIT, offset=offset),
+            use_cache=False,
+        )
+        results = response.json()['results']
+        if path is not None:
+            await asyncio.get_event_loop().run_in_executor(
+                None, dump_json_to_file, get_page_filename(path, offset), results,
+            )
+        pages[offset] = results
+
+    async def pull_pages(offsets):
+        return await asyncio.gather(
+            *[pull_page(offset) for offset in offsets], return_exceptions=True,
+        )
+
+    for _ in range(GO_PAGE_ROUNDS):
+        missing = [offset for offset in offsets if offset not in pages]
+        if not missing:
+            break
+        errors = [error for error in client.run(pull_pages(missing)) if error is not None]
+        for error in errors:
+            print('Failed to pull Go Api page: {}'.format(repr(error)))
+    missing = [offset for offset in offsets if offset not in pages]
+    if missing:
+        raise Exception('Go Api pages not pulled (offsets: {})'.format(missing))
+
+    appeals = {}
+    for offset in offsets:
+        for appeal in pages[offset]:
+            # Appeals can be shifted across pages while pulling
+            appeals[appeal['id']] = appeal
+    return [appeals[appeal_id] for appeal_id in sorted(appeals)]
+
+
+def go_api_appeal_full_data(params=None):
+    results = pull_appeals(params)
+    return {'count': len(results), 'results': results}
 
 
 def go_api_appeal(params={}):
-    response = requests.get(APPEL_URL, params=params)
+    response = get_client().get(APPEL_URL, params=params)
     return response.json()
 
 
 class GoApi():
-    DATA_FILENAME = 'data.json'
+    DATA_FILENAME = 'data'
+    PAGES_DIRNAME = 'pages'
     SUMMARY_FILENAME = 'summary.json'
 
     def __init__(self, path, test=False):
@@ -97,122 +189,117 @@ class GoApi():
 
         self.data_filename = path_join(path, GoApi.DATA_FILENAME)
         self.summary_filename = path_join(path, GoApi.SUMMARY_FILENAME)
+        self.pages_path = path_join(path, GoApi.PAGES_DIRNAME)
 
         try:
             if not test:
                 raise NotTestException()
-            self.data = load_json_from_file(self.data_filename)
+            if not table_exists(self.data_filename):
+                raise FileNotFoundError()
+            # Raw data is only loaded if summary needs to be re-calculated
             self.summary = load_pickle_from_file(self.summary_filename)
+            if 'latest_appeals' not in self.summary:
+                # Summary stored before latest appeals were indexed (by highest id)
+                raise FileNotFoundError()
             print('Using Local Go Api Data')
         except (
                 TypeError, FileNotFoundError, json.decoder.JSONDecodeError,
                 NotTestException,
-        )\
-                as e:
-            self.load_data(path)
+        ):
+            self.load_data(path, pull=not (test and table_exists(self.data_filename)))
 
-    def load_data(self, path):
-        if not self.data:
+    def load_data(self, path, pull=True):
+        if pull:
             print('Pulling Go Api Data')
-            response = requests.get(APPEL_URL)
-            params = {'limit': response.json().get('count')}
-            response = requests.get(APPEL_URL, params)
-            self.data = response.json().get('results', [])
-            dump_json_to_file(self.data_filename, self.data)
+            self.data = pull_appeals(path=self.pages_path)
+            dump_table(self.data_filename, pandas.DataFrame(self.data))
+            shutil.rmtree(self.pages_path, ignore_errors=True)
+        else:
+            self.data = table_to_records(load_table(self.data_filename))
         print('Re-calculating Go Api Data')
         self.summary = GoApi.get_summary(self.data)
         dump_pickle_to_file(self.summary_filename, self.summary)
 
     @staticmethod
     def get_summary(data):
-        summary_cw = {}
-        summary_rw = {}
+        """
+        Sum of amount_requested, amount_funded and num_beneficiaries by
+            (country|region) -> dtype -> atype -> YYYY-MM
+        and latest appeal (highest id, same as ordering=-id) by country
+        data: appeals (list)
+        """
         disaster_types = get_disaster_types()
-        for summary in [summary_cw, summary_rw]:
-            for datum in data:
-                country_detail = datum.get('country')
-                dtype = int(datum['dtype']['id'])
-                atype = ATYPE[int(datum.get('atype'))]
-                date = datetime_parser.parse(datum.get('start_date'))
-                num_beneficiaries = datum.get('num_beneficiaries')
-                amount_requested = float(datum.get('amount_requested'))
-                amount_funded = float(datum.get('amount_funded'))
-                date_formated = get_year_month_formatted(date=date)
-
-                if summary is summary_cw:
-                    # Skip if country is not provided or data are zero
-                    if not country_detail or (
-                        amount_funded == 0 and amount_requested == 0 and
-                            num_beneficiaries == 0
-                    ):
-                        continue
-                    country = int(country_detail['id'])
-                else:
-                    country = datum.get('region', {}).get('id')
-                    # Skip if region is not provided
-                    if country is None:
-                        continue
-
-                response_data = {
-                    _ts.amount_requested: amount_requested,
-                    _ts.amount_funded: amount_funded,
-                    _ts.num_beneficiaries: num_beneficiaries,
-                }
-
-                country_data = summary.get(country)
-                if country_data:
-                    dtype_data = country_data.get(dtype)
-                    if dtype_data:
-                        atype_data = dtype_data[_ts.value].get(atype)
-                        if atype_data:
-                            month_data = atype_data.get(date_formated)
-                            if month_data:
-                                month_data[_ts.amount_requested] +=\
-                                    amount_requested
-                                month_data[_ts.amount_funded] += amount_funded
-                                month_data[_ts.num_beneficiaries] +=\
-                                    num_beneficiaries
-                            else:
-                                atype_data[date_formated] = response_data
-                        else:
-                            dtype_data[_ts.value][atype] = {
-                                date_formated: response_data
-                            }
-                    else:
-                        country_data[dtype] = {
-                            _ts.name: disaster_types.get(dtype),
-                            _ts.value: {
-                                atype: {date_formated: response_data}
-                            }
-                        }
-                else:
-                    summary[country] = {
-                        dtype: {
-                            _ts.name: disaster_types.get(dtype),
-                            _ts.value: {atype: {date_formated: response_data}},
-                        }
-                    }
-        return {
-            'cw': summary_cw,
-            'rw': summary_rw
+        appeals = pandas.DataFrame(data)
+        if appeals.empty:
+            return {'cw': {}, 'rw': {}, 'latest_appeals': {}}
+
+        # Index of latest appeal (highest id) for each country
+        latest = appeals[['id']].assign(
+            country=appeals['country'].map(get_id),
+        ).dropna(subset=['country']).sort_values(
+            'id', ascending=False,
+        ).drop_duplicates('country')
+
+        num_beneficiaries = pandas.to_numeric(appeals['num_beneficiaries'], errors='coerce')
+        frame = pandas.DataFrame({
+            'country': appeals['country'].map(get_id),
+            'region': appeals['region'].map(get_id),
+            'dtype': appeals['dtype'].map(get_id),
+            'atype': appeals['atype'].astype(int).map(ATYPE),
+            # Parse all dates at once, timezone is ignored (local date of the appeal)
+            'month': pandas.to_datetime(
+                appeals['start_date'].str[:19], errors='coerce',
+            ).dt.strftime('%Y-%m'),
+            _ts.amount_requested: appeals['amount_requested'].astype(float),
+            _ts.amount_funded: appeals['amount_funded'].astype(float),
+            _ts.num_beneficiaries: num_beneficiaries.fillna(0),
+        }).dropna(subset=['dtype', 'month'])
+
+        # Skip if country is not provided or data are zero
+        is_empty = (
+            (frame[_ts.amount_funded] == 0) & (frame[_ts.amount_requested] == 0) &
+            (num_beneficiaries[frame.index] == 0)
+        )
+        cw = frame[frame['country'].notnull() & ~is_empty]
+        # Skip if region is not provided
+        rw = frame[frame['region'].notnull()]
+
+        grouped = pandas.concat([
+            cw.drop(columns=['region']).rename(columns={'country': 'key'}).assign(kind='cw'),
+            rw.drop(columns=['country']).rename(columns={'region': 'key'}).assign(kind='rw'),
+        ], ignore_index=True).groupby(
+            ['kind', 'key', 'dtype', 'atype', 'month'], sort=False,
+        )[[_ts.amount_requested, _ts.amount_funded, _ts.num_beneficiaries]].sum()
+
+        summary = {
+            'cw': {}, 'rw': {},
+            # Copy as normalize modifies the appeal
+            'latest_appeals': {
+                int(country): normalize(dict(data[index]))
+                for index, country in latest['country'].items()
+            },
         }
+        for (kind, key, dtype, atype, month), amount_requested, amount_funded, \
+                num_beneficiaries in grouped.itertuples():
+            dtype = int(dtype)
+            dtype_data = summary[kind].setdefault(int(key), {}).setdefault(dtype, {
+                _ts.name: disaster_types.get(dtype),
+                _ts.value: {},
+            })
+            dtype_data[_ts.value].setdefault(atype, {})[month] = {
+                _ts.amount_requested: float(amount_requested),
+                _ts.amount_funded: float(amount_funded),
+                _ts.num_beneficiaries: int(num_beneficiaries),
+            }
+        return summary
 
-    @staticmethod
     def latest_operation_appeal_DREF_with_budget_and_targeted_beneficiaries(
-            country_id
+            self, country_id
     ):
         """
         Latest Operation (Appeal/DREF) with budget and targeted beneficiaries
         """
-        params = {'limit': 1, 'ordering': 'id', 'country': country_id}
-        data = {}
-        try:
-            results = go_api_appeal(params).get('results', [])
-            if len(results) > 0:
-                data = normalize(results[0])
-        except json.decoder.JSONDecodeError:
-            traceback.print_exc()
-        return APPEL_URL, data
+        return APPEL_URL, self.summary['latest_appeals'].get(country_id, {})
 
     def num_of_op_that_IFRC_launched_to_by_type(
             self, country_id=None, region_id=None
@@ -0,0 +1,137 @@
+"""
+Persistent http response cache used by the http client.
+
+Responses are content-addressed by method, url and body:
+    <path>/<key[:2]>/<key>
+Each file is a JSON metadata line (url, status, validators, cached time)
+followed by the zlib compressed body.
+
+Fresh responses (younger than the host's TTL) are served from disk, stale ones
+are revalidated with ETag/Last-Modified when available and the cache is kept
+under max_size by evicting the least recently used responses.
+"""
+import os
+import json
+import time
+import zlib
+import hashlib
+import threading
+
+from .config import HttpCacheSettings
+
+# Only these headers are stored with the response
+CACHED_HEADERS = ['Content-Type', 'ETag', 'Last-Modified']
+
+
+def get_cache_key(method, url, data=None):
+    if isinstance(data, str):
+        data = data.encode('utf-8')
+    key = hashlib.sha256()
+    for part in [method.upper().encode('utf-8'), url.encode('utf-8'), data or b'']:
+        key.update(part)
+        key.update(b'\0')
+    return key.hexdigest()
+
+
+def get_cache_ttl(host):
+    return HttpCacheSettings.ttl.get(host, HttpCacheSettings.default_ttl)
+
+
+def is_fresh(response, ttl):
+    return time.time() - response.cached_at < ttl
+
+
+def get_validators(response):
+    """
+    Headers for conditional request
+    """
+    headers = {}
+    if response.headers.get('ETag'):
+        headers['If-None-Match'] = response.headers['ETag']
+    if response.headers.get('Last-Modified'):
+        headers['If-Modified-Since'] = response.headers['Last-Modified']
+    return headers
+
+
+class ResponseCache():
+
+    def __init__(self, path, max_size=HttpCacheSettings.max_size):
+        self.path = path
+        self.max_size = max_size
+        self._lock = threading.Lock()
+
+    def _get_filename(self, key):
+        return os.path.join(self.path, key[:2], key)
+
+    def load(self, key):
+        """
+        returns (metadata, content) or None
+        """
+        try:
+            with open(self._get_filename(key), 'rb') as fp:
+                meta = json.loads(fp.readline().decode('utf-8'))
+                content = zlib.decompress(fp.read())
+        except (FileNotFoundError, ValueError, zlib.error):
+            return None
+        return meta, content
+
+    def save(self, key, response):
+        self._save(key, {
+            'url': response.url,
+            'status': response.status,
+            'headers': {
+                header: response.headers[header]
+                for header in CACHED_HEADERS if response.headers.get(header)
+            },
+            'cached_at': time.time(),
+        }, response.content)
+
+    def _save(self, key, meta, content):
+        filename = self._get_filename(key)
+        os.makedirs(os.path.dirname(filename), exist_ok=True)
+        tmp_filename = '{}.{}.tmp'.format(filename, threading.get_ident())
+        with open(tmp_filename, 'wb') as fp:
+            fp.write(json.dumps(meta).encode('utf-8') + b'\n')
+            fp.write(zlib.compress(content))
+        os.replace(tmp_filename, filename)
+
+    def touch(self, key, revalidated=False):
+        """
+        Mark as recently used (and as fresh again if revalidated)
+        """
+        filename = self._get_filename(key)
+        if revalidated:
+            cached = self.load(key)
+            if cached is not None:
+                meta, content = cached
+                meta['cached_at'] = time.time()
+                self._save(key, meta, content)
+            return
+        try:
+            os.utime(filename)
+        except FileNotFoundError:
+            pass
+
+    def evict(self):
+        """
+        Remove least recently used responses until cache size is below max_size
+        """
+        with self._lock:
+            files = []
+            for root, _, filenames in os.walk(self.path):
+                for filename in filenames:
+                    filename = os.path.join(root, filename)
+                    try:
+                        stat = os.stat(filename)
+                    except FileNotFoundError:
+                        continue
+                    files.append((stat.st_mtime, stat.st_size, filename))
+            size = sum(file[1] for file in files)
+            for _, file_size, filename in sorted(files):
+                if size <= self.max_size:
+                    break
+                try:
+                    os.remove(filename)
+                except FileNotFoundError:
+                    pass
+                size -= file_size
@@ -0,0 +1,318 @@
+"""
+Shared http client used by all the collectors.
+
+One aiohttp session (one connection pool) lives in a background event loop for
+the whole run, so both sync callers (worker threads) and batched async callers
+share the same pool. Every host gets its own concurrency limit and token
+bucket (see config.HttpSettings.host_limits). 429/5xx responses and
+connection errors are retried with exponential backoff.
+
+With a ResponseCache set (client.set_cache), responses are served from and
+stored to disk (see http_cache).
+
+usage:
+    client = get_client()
+    response = client.get(url, params={'limit': 1})
+    responses = client.gather([
+        {'method': 'GET', 'url': url1},
+        {'method': 'POST', 'url': url2, 'data': json.dumps(payload)},
+    ])
+"""
+import os
+import json
+import time
+import atexit
+import asyncio
+import threading
+from urllib.parse import urlparse, urlencode
+
+import aiohttp
+from multidict import CIMultiDict
+
+from .config import HttpSettings
+from .metrics import metrics
+from .http_cache import get_cache_key, get_cache_ttl, is_fresh, get_validators
+
+# Bytes written at once for downloads
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+HEADERS = {'user-agent': 'Mozilla/5.0 (X11; Linux x86_64; rv:63.0) Gecko/20100101 Firefox/63.0'}
+
+
+class Response():
+    """
+    Fully read response (similar interface to requests.Response)
+    cached_at: time when the response was cached (None if not from cache)
+    """
+
+    def __init__(self, url, status, headers, content, cached_at=None):
+        self.url = url
+        self.status = status
+        self.headers = CIMultiDict(headers)
+        self.content = content
+        self.cached_at = cached_at
+
+    @property
+    def status_code(self):
+        return self.status
+
+    @property
+    def text(self):
+        return self.content.decode('utf-8', errors='replace')
+
+    def json(self):
+        return json.loads(self.text)
+
+
+class TokenBucket():
+    """
+    Allow `rate` requests per second with bursts of up to `burst` requests
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(
+                self.burst, self.tokens + (now - self.updated_at) * self.rate
+            )
+            self.updated_at = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class HostLimiter():
+    def __init__(self, concurrency, rate, burst):
+        self.semaphore = asyncio.Semaphore(concurrency)
+        self.bucket = TokenBucket(rate, burst)
+
+
+def build_url(url, params=None):
+    if not params:
+        return url
+    return '{}{}{}'.format(url, '&' if '?' in url else '?', urlencode(params))
+
+
+def rewrite_url(url):
+    """
+    See HttpSettings.host_rewrites
+    """
+    if not HttpSettings.host_rewrites:
+        return url
+    parsed = urlparse(url)
+    base_url = '{}://{}'.format(parsed.scheme, parsed.netloc)
+    if base_url not in HttpSettings.host_rewrites:
+        return url
+    return HttpSettings.host_rewrites[base_url] + url[len(base_url):]
+
+
+async def stream_to_file(response, filename):
+    """
+    Write response body to filename chunk by chunk (replaced once complete)
+    returns number of bytes written
+    """
+    os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+    tmp_filename = '{}.{}.tmp'.format(filename, threading.get_ident())
+    size = 0
+    try:
+        with open(tmp_filename, 'wb') as fp:
+            async for chunk in response.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                fp.write(chunk)
+                size += len(chunk)
+    except BaseException:
+        os.remove(tmp_filename)
+        raise
+    os.replace(tmp_filename, filename)
+    return size
+
+
+def get_retry_delay(attempt, response=None):
+    delay = HttpSettings.backoff * 2 ** attempt
+    if response is not None:
+        try:
+            delay = float(response.headers.get('Retry-After'))
+        except (TypeError, ValueError):
+            pass
+    # A long Retry-After would hold the host slot (and caller) for that long
+    return max(min(delay, HttpSettings.max_retry_delay), 0)
+
+
+class HttpClient():
+
+    def __init__(self, headers=HEADERS):
+        self.headers = headers
+        self.cache = None
+        self._loop = None
+        self._session = None
+        self._limiters = {}
+        self._lock = threading.Lock()
+
+    def _start(self):
+        with self._lock:
+            if self._loop is not None:
+                return
+            loop = asyncio.new_event_loop()
+            thread = threading.Thread(target=loop.run_forever, daemon=True)
+            thread.start()
+            self._session = asyncio.run_coroutine_threadsafe(
+                self._create_session(), loop,
+            ).result()
+            self._loop = loop
+
+    async def _create_session(self):
+        return aiohttp.ClientSession(
+            headers=self.headers,
+            connector=aiohttp.TCPConnector(limit=HttpSettings.pool_size),
+            timeout=aiohttp.ClientTimeout(
+                total=None,
+                sock_connect=HttpSettings.timeout,
+                sock_read=HttpSettings.timeout,
+            ),
+        )
+
+    def _get_limiter(self, host):
+        # Only called inside the client loop, no locking required
+        limiter = self._limiters.get(host)
+        if limiter is None:
+            limiter = HostLimiter(
+                *HttpSettings.host_limits.get(host, HttpSettings.default_host_limit)
+            )
+            self._limiters[host] = limiter
+        return limiter
+
+    def set_cache(self, cache):
+        self.cache = cache
+        if cache is not None:
+            cache.evict()
+
+    async def request(
+            self, method, url, params=None, data=None, headers=None, use_cache=True,
+    ):
+        url = build_url(url, params)
+        host = urlparse(url).netloc
+        ttl = get_cache_ttl(host)
+        if self.cache is None or not use_cache or ttl <= 0:
+            return await self._request(method, url, data, headers)
+
+        loop = asyncio.get_event_loop()
+        key = get_cache_key(method, url, data)
+        cached = await loop.run_in_executor(None, self.cache.load, key)
+        if cached is not None:
+            meta, content = cached
+            cached = Response(content=content, **meta)
+        if cached is not None and is_fresh(cached, ttl):
+            await loop.run_in_executor(None, self.cache.touch, key)
+            metrics.record_cache(host, 'hit')
+            return cached
+
+        if cached is not None:
+            headers = dict(headers or {}, **get_validators(cached))
+        response = await self._request(method, url, data, headers)
+        if response.status == 304 and cached is not None:
+            await loop.run_in_executor(None, self.cache.touch, key, True)
+            metrics.record_cache(host, 'revalidated')
+            return cached
+        metrics.record_cache(host, 'miss')
+        if response.status == 200:
+            await loop.run_in_executor(None, self.cache.save, key, response)
+        return response
+
+    async def _request(self, method, url, data=None, headers=None, filename=None):
+        """
+        filename: stream a 200 response body to this file (response content is empty)
+        """
+        host = urlparse(url).netloc
+        limiter = self._get_limiter(host)
+        url = rewrite_url(url)
+        for attempt in range(HttpSettings.retries + 1):
+            response, error = None, None
+            async with limiter.semaphore:
+                await limiter.bucket.acquire()
+                start = time.time()
+                try:
+                    async with self._session.request(
+                            method, url, data=data, headers=headers,
+                    ) as r:
+                        if filename is not None and r.status == 200:
+                            content, size = b'', await stream_to_file(r, filename)
+                        else:
+                            content = await r.read()
+                            size = len(content)
+                        response = Response(str(r.url), r.status, dict(r.headers), content)
+                    metrics.record_request(host, response.status, size, time.time() - start)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    error = e
+                    metrics.record_request(host, None, 0, time.time() - start)
+            if response is not None and response.status not in HttpSettings.retry_status:
+                return response
+            if attempt == HttpSettings.retries:
+                if response is not None:
+                    return response
+                raise error
+            metrics.record_retry(host)
+            await asyncio.sleep(get_retry_delay(attempt, response))
+
+    def run(self, coroutine):
+        """
+        Run coroutine in the client loop and wait for the result
+        """
+        if self._loop is None:
+            self._start()
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+    def get(self, url, **kwargs):
+        return self.run(self.request('GET', url, **kwargs))
+
+    def post(self, url, **kwargs):
+        return self.run(self.request('POST', url, **kwargs))
+
+    def download(self, url, filename, params=None, headers=None):
+        """
+        Stream url to filename (only written for 200 response, not cached)
+        returns Response without content
+        """
+        return self.run(self._request(
+            'GET', build_url(url, params), headers=headers, filename=filename,
+        ))
+
+    def gather(self, requests):
+        """
+        Run all requests (list of request kwargs) concurrently
+        Failed requests are returned as exception instead of Response
+        """
+        async def _gather():
+            return await asyncio.gather(
+                *[self.request(**request) for request in requests],
+                return_exceptions=True,
+            )
+        return self.run(_gather())
+
+    def close(self):
+        if self.cache is not None:
+            self.cache.evict()
+        if self._loop is None:
+            return
+        self.run(self._session.close())
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._loop = None
+        self._session = None
+        self._limiters = {}
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = HttpClient()
+            atexit.register(_client.close)
+    return _client
@@ -0,0 +1,78 @@
+"""
+Incremental collection: country blocks are reused from the previous output
+when none of their inputs changed.
+
+Inputs of each country are fingerprinted per source and stored next to the
+output file (<output>.fingerprints.json):
+    {iso: {source: sha256 of the source slice (None if not known)}}
+A country is collected again if any fingerprint is missing or changed.
+
+Sources are still pulled before the countries are checked (fingerprints are
+computed from the pulled data), each with its own way of not downloading
+unchanged data again (acled timestamps, conditional startnetwork download,
+http cache). A reused country only skips building its block; the only
+request this saves is the ReliefWeb latest disaster fallback (no disaster in
+the bulk index since REPORTED_EVENTS_FROM). Without the bulk index ReliefWeb
+inputs are not known, so no country is reused. The datePulled values of
+reused blocks are refreshed to this run.
+"""
+import json
+import hashlib
+
+from .common import load_json_from_file, dump_json_to_file
+from .output import load_output
+
+FINGERPRINTS_SUFFIX = '.fingerprints.json'
+# Source slice which can't be known without pulling it (always collected)
+UNKNOWN = object()
+
+
+def get_fingerprints_filename(output_path):
+    return output_path + FINGERPRINTS_SUFFIX
+
+
+def get_fingerprint(data):
+    if data is UNKNOWN:
+        return None
+    return hashlib.sha256(
+        json.dumps(data, sort_keys=True, default=str).encode('utf-8')
+    ).hexdigest()
+
+
+def get_fingerprints(inputs):
+    """
+    {source: slice} -> {source: fingerprint}
+    """
+    return {source: get_fingerprint(data) for source, data in inputs.items()}
+
+
+def dump_fingerprints(output_path, fingerprints):
+    dump_json_to_file(get_fingerprints_filename(output_path), fingerprints)
+
+
+class PreviousOutput():
+    """
+    Country blocks and fingerprints of the previous run
+    """
+
+    def __init__(self, output_path):
+        try:
+            self.countries = load_output(output_path)['countries']
+            self.fingerprints = load_json_from_file(
+                get_fingerprints_filename(output_path)
+            )
+        except (FileNotFoundError, KeyError, TypeError, json.decoder.JSONDecodeError):
+            self.countries = {}
+            self.fingerprints = {}
+
+    def get(self, iso, fingerprints):
+        """
+        Previous country block if fingerprints are unchanged (else None)
+        """
+        if (
+                iso not in self.countries or
+                None in fingerprints.values() or
+                self.fingerprints.get(iso) != fingerprints
+        ):
+            return None
+        return self.countries[iso]
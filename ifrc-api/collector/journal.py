@@ -0,0 +1,61 @@
+"""
+Checkpoint journal for collector runs.
+
+Each collected region/country is appended to <path>/journal.jsonl as soon as
+it is collected:
+    {"kind": "country", "key": "NP", "data": {..}, "fingerprints": {..}}
+A resumed run (--resume) uses the journaled blocks and only collects the
+remaining ones. The journal is removed once the output is saved.
+"""
+import os
+import json
+import threading
+
+from .storage import remove_file
+
+JOURNAL_FILENAME = 'journal.jsonl'
+
+
+class Journal():
+
+    def __init__(self, path):
+        self.filename = os.path.join(path, JOURNAL_FILENAME)
+        self._lock = threading.Lock()
+
+    def load(self):
+        """
+        returns {(kind, key): entry}
+        """
+        entries = {}
+        size = 0
+        try:
+            with open(self.filename, 'rb') as fp:
+                for line in fp:
+                    if not line.endswith(b'\n'):
+                        break
+                    try:
+                        entry = json.loads(line.decode('utf-8'))
+                    except (UnicodeDecodeError, json.decoder.JSONDecodeError):
+                        # Partial line if the run was killed while writing
+                        break
+                    entries[(entry['kind'], entry['key'])] = entry
+                    size += len(line)
+            # Drop the partial line, so new entries start on a new line
+            os.truncate(self.filename, size)
+        except FileNotFoundError:
+            pass
+        return entries
+
+    def append(self, kind, key, data, fingerprints=None):
+        line = json.dumps({
+            'kind': kind, 'key': key, 'data': data, 'fingerprints': fingerprints,
+        }) + '\n'
+        with self._lock:
+            os.makedirs(os.path.dirname(self.filename), exist_ok=True)
+            with open(self.filename, 'a') as fp:
+                fp.write(line)
+                fp.flush()
+                os.fsync(fp.fileno())
+
+    def clear(self):
+        remove_file(self.filename)
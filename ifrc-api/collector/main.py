@@ -1,24 +1,44 @@
 import json
 import time
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
 
-from .country import countries
+from .country import get_countries
 from .config import Strings, Fields
 from .common import (
-    gen_output_path, now_iso_date, seconds_to_human_readable, dump_json_to_file
+    gen_output_path, now_iso_date, seconds_to_human_readable
 )
 
 from .acled_api import AcledApi
-from .reliefweb_api import ReliefWebApi
+from .reliefweb_api import ReliefWebApi, ReliefWebIndex
 from .go_api import (
     GoApi, Regions_Id, RegionName
 )
 from .startnetwork import StartNetworkApi
-from .world_population import get_world_population
+from .world_bank import WorldBankApi, POPULATION_INDICATOR
+from .weather import ClimateApi
 from .fts_hpc import FTS
+from .http_client import get_client
+from .http_cache import ResponseCache
+from .journal import Journal
+from .output import OutputWriter
+from .metrics import metrics
+from .incremental import UNKNOWN, PreviousOutput, get_fingerprints, dump_fingerprints
 
 
-NUMBER_OF_COUNTRIES = len(countries)
 NUMBER_OF_REGIONS = len(Regions_Id)
+# Country block entries with datePulled -> source (see get_dates_pulled)
+DATE_PULLED_SOURCES = {
+    'numOfOperationsByEpidemicType': 'reliefweb',
+    'numOfOperationsByCrisisType': 'startnetwork',
+    'latestAppeal': 'go_api',
+    'climate': 'climate',
+}
+# numReportedEvents entries are by their source field
+DATE_PULLED_EVENT_SOURCES = {
+    Strings.sources.reliefWeb: 'reliefweb',
+    Strings.sources.acled: 'acled',
+}
 
 
 def print_break(text=None, char='-', len=22):
@@ -38,12 +58,15 @@ def print_region_status(region_id, index):
 def print_countries_status(country, index):
     print(
         'Collecting Data for Country: {} -- {} out of {}'.
-        format(country['iso'], index + 1, NUMBER_OF_COUNTRIES)
+        format(country['iso'], index + 1, len(get_countries()))
     )
 
 
-def print_pull_info(source, info):
+@contextmanager
+def pull_info(source, info):
     print('\t >> {}->{}'.format(source, info))
+    with metrics.timer('call', '{}.{}'.format(source, info)):
+        yield
 
 
 class GoDataSourceCollector():
@@ -52,20 +75,41 @@ class GoDataSourceCollector():
             self,
             path,
             hpc_credential,
-            test=False
+            test=False,
+            workers=1,
+            reliefweb_bulk=True,
+            http_cache=True,
     ):
         """
         hpc_up
             - username:password
+        workers
+            - number of countries collected concurrently
+        reliefweb_bulk
+            - pull reliefweb data for all countries at once
+        http_cache
+            - reuse http responses stored under path (see HttpCacheSettings)
         """
         print_break('Initializing')
+        self.journal = Journal(gen_output_path('collector', path))
+        if http_cache:
+            get_client().set_cache(ResponseCache(gen_output_path('http', path)))
         self.test = test
-        self.acledApi = AcledApi(gen_output_path('acleddata', path), test=test)
-        self.startnetwork = StartNetworkApi(
-            gen_output_path('startnetwork', path), test=test
-        )
-        self.goApi = GoApi(gen_output_path('go_api', path), test=test)
-        self.population = get_world_population(test)
+        self.workers = max(workers, 1)
+        with metrics.timer('source', 'AcledApi'):
+            self.acledApi = AcledApi(gen_output_path('acleddata', path), test=test)
+        with metrics.timer('source', 'StartNetworkApi'):
+            self.startnetwork = StartNetworkApi(
+                gen_output_path('startnetwork', path), test=test
+            )
+        with metrics.timer('source', 'GoApi'):
+            self.goApi = GoApi(gen_output_path('go_api', path), test=test)
+        with metrics.timer('source', 'ReliefWebApi'):
+            self.reliefWebApi = ReliefWebIndex() if reliefweb_bulk else ReliefWebApi
+        with metrics.timer('source', 'WorldBankApi'):
+            self.worldBank = WorldBankApi(gen_output_path('world_bank', path), test=test)
+        with metrics.timer('source', 'ClimateApi'):
+            self.climate = ClimateApi(gen_output_path('climate', path), test=test)
         """
         import pytz
         import datetime
@@ -73,8 +117,9 @@ class GoDataSourceCollector():
         TIMEZONE = pytz.timezone('Asia/Kathmandu')
         start_datetime = datetime.datetime.now(TIMEZONE)
         """
-        self.fts = FTS(hpc_credential, test=test)
-        self.fts.merge()
+        with metrics.timer('source', 'FTS'):
+            self.fts = FTS(hpc_credential, test=test)
+            self.fts.merge()
         """
         print(
             '%s -- %s' % (
@@ -84,133 +129,282 @@ class GoDataSourceCollector():
         )
         """
 
+    def get_country_inputs(self, country):
+        """
+        Source slices used for the country block (see incremental)
+        """
+        iso = country['iso']
+        country_id = country['id']
+        if isinstance(self.reliefWebApi, ReliefWebIndex):
+            iso3 = country['iso3']
+            reliefweb = [
+                self.reliefWebApi.counts.get(iso3),
+                self.reliefWebApi.epidemics.get(iso3),
+                self.reliefWebApi.latest_disasters.get(iso3),
+            ]
+        else:
+            # Only known after pulling the country data
+            reliefweb = UNKNOWN
+        return {
+            'reliefweb': reliefweb,
+            'acled': [
+                self.acledApi.get_num_of_reported_conflict_events_average(iso),
+                self.acledApi.get_num_of_reported_conflict_events_full(iso),
+            ],
+            'startnetwork': self.startnetwork.get_num_of_operations_by_crisis_type(iso),
+            'go_api': [
+                self.goApi.num_of_op_that_IFRC_launched_to_by_type(country_id),
+                self.goApi.latest_operation_appeal_DREF_with_budget_and_targeted_beneficiaries(
+                    country_id,
+                ),
+            ],
+            'fts': self.fts.get_data(iso),
+            'population': self.worldBank.get_indicator(iso, POPULATION_INDICATOR),
+            'world_bank': self.worldBank.get_data(iso),
+            'climate': self.climate.get_data(iso),
+        }
+
+    def get_dates_pulled(self):
+        """
+        datePulled of the sources in this run: {source: iso date}
+        """
+        return {
+            'reliefweb': now_iso_date(),
+            'acled': self.acledApi.get_data_pulled_dt(),
+            'startnetwork': self.startnetwork.get_data_pulled_dt(),
+            'go_api': now_iso_date(),
+            'climate': now_iso_date(),
+        }
+
+    def refresh_dates_pulled(self, country_data):
+        """
+        Country block reused from a previous run: its sources were pulled
+        again in this run
+        """
+        dates = self.get_dates_pulled()
+        for entry in country_data.get('numReportedEvents', []):
+            source = DATE_PULLED_EVENT_SOURCES.get(entry.get(Fields.source))
+            if source is not None:
+                entry[Fields.date_pulled] = dates[source]
+        for key, source in DATE_PULLED_SOURCES.items():
+            if isinstance(country_data.get(key), dict):
+                country_data[key][Fields.date_pulled] = dates[source]
+        return country_data
+
     def get_country_data(self, country):
         """
             country_id is only for go_api
         """
         iso = country['iso']
         country_id = country['id']
+        dates = self.get_dates_pulled()
 
         country_data = {
             'country': iso,
         }
 
-        print_pull_info('ReliefWebApi', 'get_count_of_reported_events_10y')
-        # Relief # of reported events (last 10 years average)
-        url, value = ReliefWebApi.get_count_of_reported_events_10y(iso)
-        country_data['numReportedEvents'] = [
-            {
+        with pull_info('ReliefWebApi', 'get_count_of_reported_events_10y'):
+            # Relief # of reported events (last 10 years average)
+            url, value = self.reliefWebApi.get_count_of_reported_events_10y(iso)
+            country_data['numReportedEvents'] = [
+                {
+                    Fields.value: value,
+                    Fields.source_url: url,
+                    Fields.source: Strings.sources.reliefWeb,
+                    Fields.date_pulled: dates['reliefweb'],
+                    Fields.unit: Strings.units.count,
+                },
+            ]
+
+        with pull_info('AcledApi', 'get_num_of_reported_conflict_events'):
+            # Acled # of reported conflict events (last 10 years average)
+            url, value = self.acledApi.get_num_of_reported_conflict_events_average(iso)
+            country_data['numReportedEvents'].append({
+                Fields.value: value,
+                Fields.source_url: url,
+                Fields.source: Strings.sources.acled,
+                Fields.date_pulled: dates['acled'],
+                Fields.unit: Strings.units.average,
+            })
+
+        with pull_info('AcledApi', 'get_num_of_reported_conflict_events_full'):
+            # Acled # of reported conflict events (last 10 years average)
+            url, value = self.acledApi.get_num_of_reported_conflict_events_full(iso)
+            country_data['numReportedEvents'].append({
+                Fields.value: value,
+                Fields.source_url: url,
+                Fields.source: Strings.sources.acled,
+                Fields.date_pulled: dates['acled'],
+            })
+
+        with pull_info('ReliefWebApi', 'get_count_of_reported_events_filtered_10y'):
+            url, value = self.reliefWebApi.get_count_of_reported_events_filtered_10y(
+                iso
+            )
+            country_data['numOfOperationsByEpidemicType'] = {
                 Fields.value: value,
                 Fields.source_url: url,
                 Fields.source: Strings.sources.reliefWeb,
-                Fields.date_pulled: now_iso_date(),
+                Fields.date_pulled: dates['reliefweb'],
                 Fields.unit: Strings.units.count,
-            },
-        ]
-
-        print_pull_info('AcledApi', 'get_num_of_reported_conflict_events')
-        # Acled # of reported conflict events (last 10 years average)
-        url, value = self.acledApi.get_num_of_reported_conflict_events_average(iso)
-        country_data['numReportedEvents'].append({
-            Fields.value: value,
-            Fields.source_url: url,
-            Fields.source: Strings.sources.acled,
-            Fields.date_pulled: self.acledApi.get_data_pulled_dt(),
-            Fields.unit: Strings.units.average,
-        })
-
-        print_pull_info('AcledApi', 'get_num_of_reported_conflict_events_full')
-        # Acled # of reported conflict events (last 10 years average)
-        url, value = self.acledApi.get_num_of_reported_conflict_events_full(iso)
-        country_data['numReportedEvents'].append({
-            Fields.value: value,
-            Fields.source_url: url,
-            Fields.source: Strings.sources.acled,
-            Fields.date_pulled: self.acledApi.get_data_pulled_dt(),
-        })
-
-        print_pull_info('ReliefWebApi', 'get_count_of_reported_events_filtered_10y')
-        url, value = ReliefWebApi.get_count_of_reported_events_filtered_10y(
-            iso
-        )
-        country_data['numOfOperationsByEpidemicType'] = {
-            Fields.value: value,
-            Fields.source_url: url,
-            Fields.source: Strings.sources.reliefWeb,
-            Fields.date_pulled: now_iso_date(),
-            Fields.unit: Strings.units.count,
-        }
+            }
 
-        print_pull_info('ReliefWebApi', 'get_latest_disaster')
-        country_data['latestDisaster'] = ReliefWebApi.get_latest_disaster(iso)
-
-        print_pull_info('Startnetwork', 'get_num_of_operations_by_crisis_type')
-        url, value = self.startnetwork.get_num_of_operations_by_crisis_type(iso)
-        country_data['numOfOperationsByCrisisType'] = {
-            Fields.value: value,
-            Fields.source_url: url,
-            Fields.source: Strings.sources.acled,
-            Fields.date_pulled: self.startnetwork.get_data_pulled_dt(),
-            Fields.unit: Strings.units.count,
-        }
+        with pull_info('ReliefWebApi', 'get_latest_disaster'):
+            country_data['latestDisaster'] = self.reliefWebApi.get_latest_disaster(iso)
+
+        with pull_info('Startnetwork', 'get_num_of_operations_by_crisis_type'):
+            url, value = self.startnetwork.get_num_of_operations_by_crisis_type(iso)
+            country_data['numOfOperationsByCrisisType'] = {
+                Fields.value: value,
+                Fields.source_url: url,
+                Fields.source: Strings.sources.acled,
+                Fields.date_pulled: dates['startnetwork'],
+                Fields.unit: Strings.units.count,
+            }
 
-        print_pull_info(
+        with pull_info(
             'GoApi', 'latest_operation_appeal_DREF_with_budget_and_targeted_beneficiaries'
-        )
-        url, value = GoApi.\
-            latest_operation_appeal_DREF_with_budget_and_targeted_beneficiaries(
-                country_id,
-            )
-        country_data['latestAppeal'] = {
-            Fields.value: value,
-            Fields.source_url: url,
-            Fields.source: Strings.sources.go_api,
-            Fields.date_pulled: now_iso_date(),
-        }
+        ):
+            url, value = self.goApi.\
+                latest_operation_appeal_DREF_with_budget_and_targeted_beneficiaries(
+                    country_id,
+                )
+            country_data['latestAppeal'] = {
+                Fields.value: value,
+                Fields.source_url: url,
+                Fields.source: Strings.sources.go_api,
+                Fields.date_pulled: dates['go_api'],
+            }
+
+        with pull_info('GoApi', 'num_of_op_that_IFRC_launched_to_by_type'):
+            country_data['appeals'] = self.goApi.\
+                num_of_op_that_IFRC_launched_to_by_type(country_id)
 
-        print_pull_info('GoApi', 'num_of_op_that_IFRC_launched_to_by_type')
-        country_data['appeals'] = self.goApi.\
-            num_of_op_that_IFRC_launched_to_by_type(country_id)
+        with pull_info('FTS', 'fts.get_data'):
+            country_data['fts'] = self.fts.get_data(iso)
 
-        print_pull_info('FTS', 'fts.get_data')
-        country_data['fts'] = self.fts.get_data(iso)
+        with pull_info('WorldBankApi', 'get_indicator'):
+            country_data['population'] = self.worldBank.get_indicator(iso, POPULATION_INDICATOR)
 
-        print_pull_info('Population', 'population.get')
-        country_data['population'] = self.population.get(iso, [])
+        with pull_info('WorldBankApi', 'get_data'):
+            # {indicator: [{date, value}]} of WorldBankSettings.indicators
+            country_data['worldBank'] = self.worldBank.get_data(iso)
+
+        with pull_info('ClimateApi', 'get_data'):
+            # Monthly average precipitation [jan..dec]
+            country_data['climate'] = {
+                Fields.value: self.climate.get_data(iso),
+                Fields.source_url: self.climate.get_source_url(iso),
+                Fields.source: Strings.sources.climate,
+                Fields.date_pulled: dates['climate'],
+                Fields.unit: Strings.units.millimeter,
+            }
 
         return country_data
 
-    def collect(self):
+    def collect(self, previous_output=None, resume=False, output_file=None):
+        """
+        previous_output
+            - output file of the previous run, countries with unchanged inputs
+              are reused from it instead of being collected again
+        resume
+            - continue the last (failed) run, already collected regions and
+              countries are used from the journal
+        output_file
+            - stream blocks to this file as they are collected (see output)
+              instead of keeping them for dump_json
+        """
         self.country_collector = {}
         self.region_collector = {}
+        self.fingerprints = {}
+        previous = PreviousOutput(previous_output) if previous_output else None
+        if resume:
+            journal = self.journal.load()
+            print('Resuming with {} collected regions/countries'.format(len(journal)))
+        else:
+            journal = {}
+            self.journal.clear()
+
+        if output_file is None:
+            self._collect(previous, journal, self.add_block)
+            return
+        print('Streaming to: {}'.format(output_file))
+        with OutputWriter(output_file) as writer:
+            self._collect(previous, journal, writer.write)
+        self.save_state(output_file)
+
+    def add_block(self, kind, key, data):
+        collector = self.region_collector if kind == 'region' else self.country_collector
+        collector[key] = data
+
+    def _collect(self, previous, journal, write_block):
         print_break('Collecting Data')
 
         for index, region_id in enumerate(Regions_Id):
             print_region_status(region_id, index)
-            self.region_collector[RegionName[region_id]] = {
+            region = RegionName[region_id]
+            if ('region', region) in journal:
+                write_block('region', region, journal[('region', region)]['data'])
+                continue
+            region_data = {
                 'appeals': self.goApi.num_of_op_that_IFRC_launched_to_by_type(
                         region_id=region_id
                     ),
             }
+            self.journal.append('region', region, region_data)
+            write_block('region', region, region_data)
 
         print_break(len=44)
 
-        for index, country in enumerate(countries):
+        countries = get_countries()
+        _countries = countries[:1] if self.test else countries
+
+        def collect_country(index_country):
+            index, country = index_country
             print_countries_status(country, index)
-            self.country_collector[country['iso']] = self.get_country_data(country)
-            if self.test:
-                break
+            entry = journal.get(('country', country['iso']))
+            if entry is not None:
+                return (
+                    country['iso'], self.refresh_dates_pulled(entry['data']),
+                    entry['fingerprints'],
+                )
+            with metrics.timer('country', country['iso']):
+                fingerprints = get_fingerprints(self.get_country_inputs(country))
+                country_data = previous and previous.get(country['iso'], fingerprints)
+                if country_data is not None:
+                    print('\t >> Unchanged, using previous output')
+                    country_data = self.refresh_dates_pulled(country_data)
+                else:
+                    country_data = self.get_country_data(country)
+            self.journal.append('country', country['iso'], country_data, fingerprints)
+            return country['iso'], country_data, fingerprints
+
+        # map keeps the input order, so the output matches a sequential run
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for iso, country_data, fingerprints in executor.map(
+                    collect_country, enumerate(_countries)
+            ):
+                write_block('country', iso, country_data)
+                self.fingerprints[iso] = fingerprints
+
+    def save_state(self, path):
+        """
+        Output is complete, keep fingerprints for the next incremental run
+        """
+        dump_fingerprints(path, self.fingerprints)
+        self.journal.clear()
 
     def dump_json(self, path):
         if self.region_collector is None or self.country_collector is None:
             raise Exception('First call collect()')
         print('-' * 44)
         print('Saving to json: {}'.format(path))
-        collector = {
-            'regions': self.region_collector,
-            'countries': self.country_collector,
-        }
-        dump_json_to_file(path, collector)
+        with OutputWriter(path) as writer:
+            for region, region_data in self.region_collector.items():
+                writer.write('region', region, region_data)
+            for iso, country_data in self.country_collector.items():
+                writer.write('country', iso, country_data)
+        self.save_state(path)
 
     def dump_csv(self):
         """
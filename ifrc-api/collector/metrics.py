@@ -0,0 +1,174 @@
+"""
+Run metrics (timings and http requests) for the collector.
+
+    with metrics.timer('source', 'GoApi'):
+        ...
+    metrics.dump('output/output.json.metrics.json')
+
+Report:
+    timings: {group: {name: histogram}} (e.g. source, call, country)
+    requests: {host: {
+        requests, status: {code: count}, errors, retries, bytes,
+        cache: {hit, miss, revalidated}, latency: histogram,
+    }}
+    histogram: {count, total, min, max, mean, buckets: [[upper bound (s), count]]}
+"""
+import os
+import json
+import time
+import threading
+from contextlib import contextmanager
+
+METRICS_SUFFIX = '.metrics.json'
+# Latency histogram upper bounds (seconds), last one is for everything slower
+LATENCY_BUCKETS = [0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, float('inf')]
+
+
+def get_metrics_filename(output_path):
+    return output_path + METRICS_SUFFIX
+
+
+class Histogram():
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+
+    def add(self, value):
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def report(self):
+        return {
+            'count': self.count,
+            'total': self.total,
+            'min': self.min,
+            'max': self.max,
+            'mean': self.total / self.count if self.count else None,
+            'buckets': [
+                # inf is not valid json
+                [bound if bound != float('inf') else None, count]
+                for bound, count in zip(self.buckets, self.counts) if count
+            ],
+        }
+
+
+class HostMetrics():
+
+    def __init__(self):
+        self.requests = 0
+        self.status = {}
+        self.errors = 0
+        self.retries = 0
+        self.bytes = 0
+        self.cache = {'hit': 0, 'miss': 0, 'revalidated': 0}
+        self.latency = Histogram()
+
+    def report(self):
+        lookups = sum(self.cache.values())
+        return {
+            'requests': self.requests,
+            'status': self.status,
+            'errors': self.errors,
+            'retries': self.retries,
+            'bytes': self.bytes,
+            'cache': dict(
+                self.cache,
+                hit_rate=(
+                    (self.cache['hit'] + self.cache['revalidated']) / lookups
+                    if lookups else None
+                ),
+            ),
+            'latency': self.latency.report(),
+        }
+
+
+class Metrics():
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.started_at = time.time()
+            self.timings = {}
+            self.hosts = {}
+
+    def _get_host(self, host):
+        if host not in self.hosts:
+            self.hosts[host] = HostMetrics()
+        return self.hosts[host]
+
+    def record_time(self, group, name, seconds):
+        with self._lock:
+            timings = self.timings.setdefault(group, {})
+            if name not in timings:
+                timings[name] = Histogram()
+            timings[name].add(seconds)
+
+    @contextmanager
+    def timer(self, group, name):
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.record_time(group, name, time.time() - start)
+
+    def record_request(self, host, status, size, seconds):
+        """
+        status: None if request failed (connection error/timeout)
+        """
+        with self._lock:
+            host_metrics = self._get_host(host)
+            host_metrics.requests += 1
+            host_metrics.latency.add(seconds)
+            if status is None:
+                host_metrics.errors += 1
+                return
+            host_metrics.status[status] = host_metrics.status.get(status, 0) + 1
+            host_metrics.bytes += size
+            if status >= 400:
+                host_metrics.errors += 1
+
+    def record_retry(self, host):
+        with self._lock:
+            self._get_host(host).retries += 1
+
+    def record_cache(self, host, result):
+        """
+        result: hit, miss or revalidated
+        """
+        with self._lock:
+            self._get_host(host).cache[result] += 1
+
+    def report(self):
+        with self._lock:
+            return {
+                'started_at': self.started_at,
+                'duration': time.time() - self.started_at,
+                'timings': {
+                    group: {name: histogram.report() for name, histogram in timings.items()}
+                    for group, timings in self.timings.items()
+                },
+                'requests': {host: metrics.report() for host, metrics in self.hosts.items()},
+            }
+
+    def dump(self, filename):
+        # common.dump_json_to_file is not used as common imports the http client
+        os.makedirs(os.path.dirname(filename) or '.', exist_ok=True)
+        with open(filename, 'w') as fp:
+            json.dump(self.report(), fp, indent=2)
+
+
+metrics = Metrics()
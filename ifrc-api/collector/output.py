@@ -0,0 +1,105 @@
+"""
+Streaming writer for the collector output.
+
+Region and country blocks are written as soon as they are collected, so the
+whole document is never held in memory.
+
+Formats (by output file extension):
+    .json: {"regions": {name: {..}, ..}, "countries": {iso: {..}, ..}}
+        Written to a temporary file which replaces the output file once
+        complete (a partial document is not valid json).
+    .ndjson/.jsonl: one {"kind": "region"|"country", "key": .., "data": {..}} per line
+        Written to the output file directly, flushed after every block, so
+        consumers can read (tail) blocks while the collector is running. The
+        file is complete once the collector exits successfully, a failed run
+        leaves the blocks written so far.
+"""
+import os
+import json
+
+from .storage import remove_file
+
+NDJSON_EXTENSIONS = ('.ndjson', '.jsonl')
+# (block kind, json section) in output order
+OUTPUT_SECTIONS = [('region', 'regions'), ('country', 'countries')]
+
+
+def is_ndjson(path):
+    return path.lower().endswith(NDJSON_EXTENSIONS)
+
+
+def load_output(path):
+    """
+    Output file (any format) -> {'regions': {..}, 'countries': {..}}
+    """
+    if not is_ndjson(path):
+        with open(path) as fp:
+            return json.load(fp)
+    output = {section: {} for _, section in OUTPUT_SECTIONS}
+    sections = dict(OUTPUT_SECTIONS)
+    with open(path) as fp:
+        for line in fp:
+            block = json.loads(line)
+            output[sections[block['kind']]][block['key']] = block['data']
+    return output
+
+
+class OutputWriter():
+
+    def __init__(self, path):
+        self.path = path
+        self.ndjson = is_ndjson(path)
+        # ndjson is streamed to the output file itself (see above)
+        self.tmp_path = path if self.ndjson else '{}.{}.tmp'.format(path, os.getpid())
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.fp = open(self.tmp_path, 'w')
+        # Index of the current section (json only)
+        self.section = -1
+        self.count = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _start_section(self, section):
+        if section < self.section:
+            raise ValueError('{} blocks should be written before {} blocks'.format(
+                OUTPUT_SECTIONS[section][0], OUTPUT_SECTIONS[self.section][0],
+            ))
+        # Sections without blocks are written empty
+        while self.section < section:
+            self.fp.write('}, ' if self.section >= 0 else '{')
+            self.section += 1
+            self.fp.write('{}: {{'.format(json.dumps(OUTPUT_SECTIONS[self.section][1])))
+            self.count = 0
+
+    def write(self, kind, key, data):
+        if self.ndjson:
+            self.fp.write(json.dumps({'kind': kind, 'key': key, 'data': data}) + '\n')
+            self.fp.flush()
+            return
+        self._start_section([_kind for _kind, _ in OUTPUT_SECTIONS].index(kind))
+        self.fp.write('{}{}: {}'.format(
+            ', ' if self.count else '', json.dumps(key), json.dumps(data),
+        ))
+        self.count += 1
+
+    def close(self):
+        if not self.ndjson:
+            self._start_section(len(OUTPUT_SECTIONS) - 1)
+            self.fp.write('}}')
+        self.fp.flush()
+        os.fsync(self.fp.fileno())
+        self.fp.close()
+        if not self.ndjson:
+            os.replace(self.tmp_path, self.path)
+
+    def abort(self):
+        self.fp.close()
+        if not self.ndjson:
+            remove_file(self.tmp_path)
@@ -1,19 +1,23 @@
-import requests
 import json
 import logging
+from datetime import datetime
+from dateutil.relativedelta import relativedelta
 
 from .country import get_country_iso3
+from .utils import get_dict
 from .config import ReliefFields as _ts
 from .common import (
     get_months_from_years, get_iso_month_start_end_day,
     get_year_month_formatted, async_post, normal_to_camel_case
 )
+from .http_client import get_client
 
 logger = logging.getLogger(__name__)
 
 
-def pull_data(url, payload, data_collector=[]):
-    response = requests.post(url, data=json.dumps(payload))
+def pull_data(url, payload, data_collector=None):
+    data_collector = [] if data_collector is None else data_collector
+    response = get_client().post(url, data=json.dumps(payload))
     data = json.loads(response.text).get('data')
     next_url = json.loads(response.text).\
         get('links', {}).get('next', {}).get('href')
@@ -32,10 +36,56 @@ def pull_data(url, payload, data_collector=[]):
     return data_collector
 
 
+def pull_all_data(url, payloads):
+    """
+    Pull all the pages for each payload, pages are fetched concurrently
+    returns list of records for each payload
+    """
+    def get_page(payload, offset):
+        return dict(payload, limit=R_PAGE_LIMIT, offset=offset, sort=['id:asc'])
+
+    def extract(response, payload):
+        data = (response or {}).get('json') or {}
+        if data.get('data') is None:
+            print('-' * 22)
+            logger.error('url: %s\npayload: %s\nresponse: %s', url, payload, data)
+            print('-' * 22)
+        return data.get('totalCount') or 0, data.get('data') or []
+
+    collectors = [[] for _ in payloads]
+    next_pages = []
+    for response, index in async_post([
+            (url, get_page(payload, 0), index)
+            for index, payload in enumerate(payloads)
+    ]):
+        total, data = extract(response, payloads[index])
+        collectors[index].extend(data)
+        next_pages.extend([
+            (url, get_page(payloads[index], offset), index)
+            for offset in range(R_PAGE_LIMIT, total, R_PAGE_LIMIT)
+        ])
+
+    for response, index in async_post(next_pages):
+        collectors[index].extend(extract(response, payloads[index])[1])
+    return collectors
+
+
 RELIEFWEB_API = 'https://api.reliefweb.int/v1'
 R_DISASTERS_URL = RELIEFWEB_API + '/disasters?appname=ifrc-go'
 R_DISASTER_URL = RELIEFWEB_API + '/disasters/{}?appname=ifrc-go'
 R_REPORTS_URL = RELIEFWEB_API + '/reports?appname=ifrc-go'
+# Max allowed limit by reliefweb
+R_PAGE_LIMIT = 1000
+REPORTED_EVENTS_FROM = '2008-01-01T00:00:00+00:00'
+EPIDEMIC_NAMES = [
+    'Cholera outbreak', 'Meningitis', 'Rift Valley fever',
+    'Viral haemorrhagic fevers', 'Viral hepatitis A B C E',
+    'Yellow fever', 'others',
+]
+LATEST_DISASTER_FIELDS = [
+    'id', 'name', 'glide', 'current', 'url', 'description', 'date.created',
+    'country.iso3', 'primary_type',
+]
 PRIMARY_COUNTRY_ISO3_FIELDNAME = 'primary_country.iso3'
 
 DISASTER_TRANSLATE_IFRC = {
@@ -62,12 +112,12 @@ https://api.reliefweb.int/v1/disasters/
 """
 
 
-def normalize_disaster(response):
-    json_response = response.json()
-    url = json_response['links']['self']['href']
-    disaster = json_response['data'][0]['fields']
+def normalize_disaster(disaster, url=None):
+    """
+    disaster: fields of the disaster with LATEST_DISASTER_FIELDS included
+    """
     return {
-        _ts.source_url: url,
+        _ts.source_url: url or R_DISASTER_URL.format(disaster['id']),
 
         _ts.id: disaster['id'],
         _ts.name: disaster['name'],
@@ -85,6 +135,67 @@ def normalize_disaster(response):
     }
 
 
+def get_epidemic_payloads(names, from_d, to_d, country_iso=None, include=[]):
+    """
+    Payload for each name (others: negate of all names)
+    """
+    payloads = []
+    for _name in names:
+        conditions = [
+            {
+                'field': 'name',
+                'value': names if _name == 'others' else _name,
+                'negate': _name == 'others',
+            },
+            {
+                'field': 'date.created',
+                'value': {
+                    'from': from_d.isoformat(),
+                    'to': to_d.isoformat(),
+                }
+            },
+        ]
+        if country_iso is not None:
+            conditions.append({
+                'field': PRIMARY_COUNTRY_ISO3_FIELDNAME,
+                'value': get_country_iso3(country_iso).lower(),
+            })
+        payloads.append({
+            'fields': {'include': ['name', 'date.created'] + include},
+            'filter': {
+                'operator': 'AND',
+                'conditions': conditions,
+            },
+        })
+    return payloads
+
+
+def get_epidemic_date_range():
+    date_range = get_months_from_years(10)
+    from_d, _ = get_iso_month_start_end_day(**date_range[0])
+    _, to_d = get_iso_month_start_end_day(**date_range[-1])
+    return from_d, to_d + relativedelta(days=1)
+
+
+def get_disaster_month(disaster):
+    created = get_dict(disaster, 'fields__date__created')
+    return get_year_month_formatted(
+        date=datetime.strptime(created[:10], '%Y-%m-%d')
+    )
+
+
+def get_disaster_iso3(disaster):
+    return (get_dict(disaster, 'fields__primary_country__iso3') or '').upper()
+
+
+def count_by_month(disasters):
+    counts = {}
+    for disaster in disasters:
+        month = get_disaster_month(disaster)
+        counts[month] = counts.get(month, 0) + 1
+    return {month: counts[month] for month in sorted(counts)}
+
+
 class ReliefWebApi():
 
     @staticmethod
@@ -99,18 +210,18 @@ class ReliefWebApi():
 
     @staticmethod
     def get_latest_disaster(country_iso):
-        response = requests.get(R_DISASTERS_URL, params={
-            PRIMARY_COUNTRY_ISO3_FIELDNAME: country_iso,
+        response = get_client().post(R_DISASTERS_URL, data=json.dumps({
             'limit': 1,
-            'sort': 'date:desc',
-        })
+            'sort': ['date.created:desc', 'id:desc'],
+            'fields': {'include': LATEST_DISASTER_FIELDS},
+            'filter': {
+                'field': PRIMARY_COUNTRY_ISO3_FIELDNAME,
+                'value': get_country_iso3(country_iso).lower(),
+            },
+        }))
         disasters = response.json().get('data', [])
         if len(disasters) > 0:
-            disaster_id = disasters[0]['id']
-            disaster = normalize_disaster(
-                requests.get(R_DISASTER_URL.format(disaster_id))
-            )
-            return disaster
+            return normalize_disaster(disasters[0]['fields'])
 
     @staticmethod
     def get_count_of_reported_events_filtered_10y_pull(iso, names, date_range):
@@ -151,7 +262,7 @@ class ReliefWebApi():
                         'date': date,
                     }
                 ))
-        response = async_post(urls_with_params, limit_per_host=5)
+        response = async_post(urls_with_params)
         return response
 
         """
@@ -162,14 +273,19 @@ class ReliefWebApi():
         ]
         """
 
+    @staticmethod
+    def get_count_of_reported_events_filtered_10y_bulk(iso, names):
+        payloads = get_epidemic_payloads(names, *get_epidemic_date_range(), country_iso=iso)
+        return {
+            normal_to_camel_case(_name): count_by_month(disasters)
+            for _name, disasters in zip(names, pull_all_data(R_DISASTERS_URL, payloads))
+        }
+
     @staticmethod
     def get_count_of_reported_events_filtered_10y(
             country_iso,
-            names=[
-                'Cholera outbreak', 'Meningitis', 'Rift Valley fever',
-                'Viral haemorrhagic fevers', 'Viral hepatitis A B C E',
-                'Yellow fever', 'others',
-            ],
+            names=EPIDEMIC_NAMES,
+            bulk=True,
     ):
         # TODO: Send hepatitis as a array
         """
@@ -181,7 +297,14 @@ class ReliefWebApi():
         - Viral hepatitis (A, B, C, E)
         - Yellow fever
         - Others...
+
+        bulk: pull the matching disasters for the whole date range and count
+              by month locally instead of one request per name per month
         """
+        if bulk:
+            return R_DISASTERS_URL, ReliefWebApi.get_count_of_reported_events_filtered_10y_bulk(
+                country_iso, names,
+            )
         collector = {}
         date_range = get_months_from_years(10)
         responses = ReliefWebApi.get_count_of_reported_events_filtered_10y_pull(
@@ -208,7 +331,7 @@ class ReliefWebApi():
         """
         # of reported events (last 10 years average)
         """
-        response = requests.post(R_DISASTERS_URL, data=json.dumps({
+        response = get_client().post(R_DISASTERS_URL, data=json.dumps({
             'limit': 1,
             'filter': {
                 'operator': 'AND',
@@ -216,7 +339,7 @@ class ReliefWebApi():
                     {
                         'field': 'date.created',
                         'value': {
-                            'from': '2008-01-01T00:00:00+00:00',
+                            'from': REPORTED_EVENTS_FROM,
                         }
                     },
                     {
@@ -229,6 +352,73 @@ class ReliefWebApi():
         return response.url, response.json().get('totalCount')
 
 
+class ReliefWebIndex():
+    """
+    Reliefweb data for all countries pulled once and indexed by ISO3
+    (instead of multiple requests for each country)
+    """
+
+    def __init__(self, names=EPIDEMIC_NAMES):
+        self.names = names
+        self.counts = {}
+        self.latest_disasters = {}
+        self.epidemics = {}
+        self.load()
+
+    def load(self):
+        print('Pulling ReliefWeb Data')
+        # Disasters since REPORTED_EVENTS_FROM (for counts and latest disaster)
+        payload = {
+            'fields': {
+                'include': LATEST_DISASTER_FIELDS + [PRIMARY_COUNTRY_ISO3_FIELDNAME],
+            },
+            'filter': {
+                'field': 'date.created',
+                'value': {'from': REPORTED_EVENTS_FROM},
+            },
+        }
+        # Epidemic disasters for each name (for epidemic monthly counts)
+        payloads = [payload] + get_epidemic_payloads(
+            self.names, *get_epidemic_date_range(),
+            include=[PRIMARY_COUNTRY_ISO3_FIELDNAME],
+        )
+        disasters, *epidemics = pull_all_data(R_DISASTERS_URL, payloads)
+
+        for disaster in sorted(
+                disasters,
+                key=lambda d: (get_dict(d, 'fields__date__created'), int(d['id'])),
+                reverse=True,
+        ):
+            iso3 = get_disaster_iso3(disaster)
+            self.counts[iso3] = self.counts.get(iso3, 0) + 1
+            if iso3 not in self.latest_disasters:
+                self.latest_disasters[iso3] = disaster['fields']
+
+        for _name, disasters in zip(self.names, epidemics):
+            by_country = {}
+            for disaster in disasters:
+                by_country.setdefault(get_disaster_iso3(disaster), []).append(disaster)
+            for iso3, _disasters in by_country.items():
+                self.epidemics.setdefault(iso3, {})[_name] = count_by_month(_disasters)
+
+    def get_count_of_reported_events_10y(self, country_iso):
+        return R_DISASTERS_URL, self.counts.get(get_country_iso3(country_iso), 0)
+
+    def get_count_of_reported_events_filtered_10y(self, country_iso):
+        epidemics = self.epidemics.get(get_country_iso3(country_iso), {})
+        return R_DISASTERS_URL, {
+            normal_to_camel_case(_name): epidemics.get(_name, {})
+            for _name in self.names
+        }
+
+    def get_latest_disaster(self, country_iso):
+        disaster = self.latest_disasters.get(get_country_iso3(country_iso))
+        if disaster is None:
+            # No disaster since REPORTED_EVENTS_FROM, look for older ones
+            return ReliefWebApi.get_latest_disaster(country_iso)
+        return normalize_disaster(disaster)
+
+
 if __name__ == '__main__':
     disaster = [
         'Cholera outbreak', 'Meningitis', 'Rift Valley fever',
@@ -1,11 +1,16 @@
+import os
 from os.path import join as path_join
+import io
+import csv
 import json
+import hashlib
 import logging
 import pandas
+from collections import Counter
 
 from .country import get_country_iso2
 from .config import NotTestException
-from .utils import dataframe_to_nested_dict
+from .storage import dump_table, append_table, load_table, table_exists
 from .common import (
     load_json_from_file, dump_json_to_file, load_csv_to_dict,
     dump_url_to_file, get_file_created_iso_date,
@@ -14,50 +19,200 @@ from .common import (
 logger = logging.getLogger(__name__)
 
 ALERTS_URL = 'https://startnetwork.org/api/v1/start-fund-all-alerts'
+# Only these columns are used from the alerts
+ALERTS_COLUMNS = ['Country', 'Crisis Type']
+# Bytes hashed at once
+HASH_CHUNK_SIZE = 64 * 1024
+
+
+def get_file_sha256(filename, size=None):
+    """
+    sha256 of the first size bytes (whole file if size is None)
+    """
+    sha256 = hashlib.sha256()
+    with open(filename, 'rb') as fp:
+        remaining = size
+        while remaining is None or remaining > 0:
+            chunk = fp.read(
+                HASH_CHUNK_SIZE if remaining is None else min(HASH_CHUNK_SIZE, remaining)
+            )
+            if not chunk:
+                break
+            sha256.update(chunk)
+            if remaining is not None:
+                remaining -= len(chunk)
+    return sha256.hexdigest()
+
+
+def merge_summaries(summary, new_summary):
+    """
+    Add counts of new_summary to summary ({iso2: {crisis type: count}})
+    """
+    for iso2, crisis_types in new_summary.items():
+        _crisis_types = summary.setdefault(iso2, {})
+        for crisis_type, count in crisis_types.items():
+            _crisis_types[crisis_type] = _crisis_types.get(crisis_type, 0) + count
+    return summary
 
 
 class StartNetworkApi():
-    DATA_FILENAME = 'data.csv'
+    # Downloaded csv, stored as table for faster loading
+    DATA_CSV_FILENAME = 'data.csv'
+    DATA_FILENAME = 'data'
     SUMMARY_FILENAME = 'summary.json'
+    # Validators (etag, last_modified), size/sha256 of the downloaded csv and
+    # table rows, saved once table and summary are saved
+    DOWNLOAD_FILENAME = 'download.json'
 
     def __init__(self, path, test=False):
         self.data = None
         self.summary = None
 
+        self.data_csv_filename = path_join(path, StartNetworkApi.DATA_CSV_FILENAME)
         self.data_filename = path_join(path, StartNetworkApi.DATA_FILENAME)
         self.summary_filename = path_join(
             path, StartNetworkApi.SUMMARY_FILENAME
         )
+        self.download_filename = path_join(path, StartNetworkApi.DOWNLOAD_FILENAME)
 
         try:
             if not test:
                 raise NotTestException()
-            self.data = load_csv_to_dict(self.data_filename)
+            self.data = load_table(self.data_filename, columns=ALERTS_COLUMNS)
             self.summary = load_json_from_file(self.summary_filename)
             print('Using Local startnetwork Data')
         except (
                 TypeError, FileNotFoundError, json.decoder.JSONDecodeError,
                 NotTestException,
-        )\
-                as e:
-            self.load_data(path)
+        ):
+            self.load_data(path, pull=not (test and table_exists(self.data_filename)))
 
     def get_data_pulled_dt(self):
-        return get_file_created_iso_date(self.data_filename)
+        return get_file_created_iso_date(self.data_csv_filename)
 
-    def load_data(self, path):
-        if not self.data:
+    def load_data(self, path, pull=True):
+        download = None
+        appended = None
+        if pull:
             print('Pulling startnetwork Data')
-            dump_url_to_file(ALERTS_URL, self.data_filename)
-            self.data = load_csv_to_dict(self.data_filename)
-        print('Re-calculating startnetwork Data')
-        self.summary = self.get_summary(self.data)
+            previous = self.load_download()
+            modified, download, appended = self.pull(previous)
+            if not modified:
+                try:
+                    self.data = load_table(self.data_filename, columns=ALERTS_COLUMNS)
+                    self.summary = load_json_from_file(self.summary_filename)
+                    print('No new startnetwork Data')
+                    return
+                except (TypeError, FileNotFoundError, json.decoder.JSONDecodeError):
+                    pass
+            if appended is not None:
+                self.load_appended(previous, appended)
+            if self.data is None:
+                dump_table(
+                    self.data_filename,
+                    pandas.DataFrame(load_csv_to_dict(self.data_csv_filename)),
+                )
+        if self.data is None:
+            self.data = load_table(self.data_filename, columns=ALERTS_COLUMNS)
+            print('Re-calculating startnetwork Data')
+            self.summary = self.get_summary(self.data)
         dump_json_to_file(self.summary_filename, self.summary)
+        # Saved last: a run which dies before this pulls (and re-calculates) again
+        if download is not None:
+            download['rows'] = len(self.data)
+            dump_json_to_file(self.download_filename, download)
+
+    def load_appended(self, previous, appended):
+        """
+        Add appended rows to the stored table and summary (self.data/self.summary)
+        Nothing is loaded if those are not the ones saved with the previous download
+        """
+        try:
+            data = load_table(self.data_filename, columns=ALERTS_COLUMNS)
+            summary = load_json_from_file(self.summary_filename)
+        except (TypeError, FileNotFoundError, json.decoder.JSONDecodeError):
+            return
+        if len(data) != previous.get('rows'):
+            return
+        print('Adding {} new startnetwork alerts'.format(len(appended)))
+        # Only the new rows are stored, csv is not parsed again
+        append_table(self.data_filename, appended)
+        self.data = pandas.concat(
+            [data, appended.reindex(columns=ALERTS_COLUMNS)], ignore_index=True,
+        )
+        self.summary = merge_summaries(summary, self.get_summary(appended))
+
+    def load_download(self):
+        """
+        Validators and size/sha256 (and table rows) saved with the last download
+        """
+        if not os.path.exists(self.data_csv_filename):
+            return {}
+        try:
+            return load_json_from_file(self.download_filename)
+        except (FileNotFoundError, json.decoder.JSONDecodeError):
+            return {}
+
+    def pull(self, previous):
+        """
+        Conditional download of the alerts csv
+        returns (
+            modified,
+            download (validators and size/sha256 of the csv, saved by load_data),
+            appended rows DataFrame or None if csv was rewritten,
+        )
+        """
+        headers = {}
+        if previous.get('etag'):
+            headers['If-None-Match'] = previous['etag']
+        if previous.get('last_modified'):
+            headers['If-Modified-Since'] = previous['last_modified']
+
+        new_csv_filename = self.data_csv_filename + '.new'
+        response = dump_url_to_file(ALERTS_URL, new_csv_filename, headers=headers)
+        if response.status == 304:
+            # Keep pulled date (file mtime) current
+            os.utime(self.data_csv_filename)
+            return False, dict(previous), None
+        if response.status != 200:
+            raise Exception('Startnetwork alerts pull failed ({})'.format(response.status))
+
+        appended = self.get_appended_rows(previous, new_csv_filename)
+        os.replace(new_csv_filename, self.data_csv_filename)
+        return True, {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'size': os.path.getsize(self.data_csv_filename),
+            'sha256': get_file_sha256(self.data_csv_filename),
+        }, appended
+
+    @staticmethod
+    def get_appended_rows(download, filename):
+        """
+        Rows added at the end of the previous csv (None if the previous rows changed)
+        """
+        size = download.get('size')
+        if not size or os.path.getsize(filename) < size:
+            return None
+        with open(filename, 'rb') as fp:
+            fp.seek(size - 1)
+            # Previous csv must end with a complete row
+            if fp.read(1) != b'\n':
+                return None
+        if get_file_sha256(filename, size) != download.get('sha256'):
+            return None
+        with open(filename, 'rb') as fp:
+            header = fp.readline()
+            fp.seek(size)
+            rows = fp.read()
+        reader = csv.DictReader(io.StringIO(
+            (header + rows).decode('utf-8', errors='ignore'), newline='',
+        ))
+        return pandas.DataFrame(list(reader), columns=reader.fieldnames)
 
     def get_crisis_types(self):
         crisis_types = {}
-        for datum in self.data:
-            crisis_type = datum.get('Crisis Type')
+        for crisis_type in self.data['Crisis Type']:
             if crisis_types.get(crisis_type):
                 crisis_types[crisis_type] += 1
             else:
@@ -66,18 +221,37 @@ class StartNetworkApi():
 
     @staticmethod
     def get_summary(data):
-        def get_iso2(index):
-            country = data[index].get('Country').split(' [')[0]
-            return get_country_iso2(name=country)
-
-        def get_crisis_type(index):
-            return data[index].get('Crisis Type').lower()
-
-        dataframe = pandas.DataFrame(data)
-        op = dataframe.groupby(
-            [get_iso2, get_crisis_type]
-        ).agg({'Country': 'count'})
-        summary = dataframe_to_nested_dict(op)
+        """
+        # of alerts by country and crisis type: {iso2: {crisis type: count}}
+        Alerts with unresolved country are skipped (and reported)
+        """
+        # Count once for each distinct (country, crisis type)
+        counts = Counter(zip(data['Country'], data['Crisis Type']))
+
+        # Resolve each distinct country name once ('Kenya [Turkana]' -> Kenya)
+        names = {
+            country: country.split(' [')[0]
+            for country, _ in counts if isinstance(country, str)
+        }
+        countries = {country: get_country_iso2(name=name) for country, name in names.items()}
+
+        summary = {}
+        unresolved = Counter()
+        for (country, crisis_type), count in counts.items():
+            iso2 = countries.get(country)
+            if iso2 is None or not isinstance(crisis_type, str):
+                unresolved[names.get(country, country)] += count
+                continue
+            crisis_types = summary.setdefault(iso2, {})
+            crisis_type = crisis_type.lower()
+            crisis_types[crisis_type] = crisis_types.get(crisis_type, 0) + count
+
+        if unresolved:
+            print('Startnetwork alerts skipped (unresolved country/crisis type): {}'.format(
+                ', '.join(
+                    '{} ({})'.format(country, count) for country, count in unresolved.items()
+                )
+            ))
         return summary
 
     def get_num_of_operations_by_crisis_type(self, country_iso=None):
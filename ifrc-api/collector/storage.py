@@ -0,0 +1,177 @@
+"""
+Table storage for raw source data.
+
+Tables (pandas DataFrame) are stored as parquet when pyarrow is installed
+(read with memory-mapping and only the requested columns) and as columnar
+JSON ({column: [values]}) otherwise.
+
+Object columns with values other than strings (nested dict/list or mixed
+types, which parquet can't store) are stored as JSON strings in parquet and
+decoded on load.
+
+Rows can be appended without rewriting the table: they are stored as parts
+(<filename>.part0001..) loaded after the table rows, parts are merged into the
+table once there are MAX_TABLE_PARTS.
+
+usage:
+    dump_table('.cache/go_api/data', dataframe)
+    append_table('.cache/go_api/data', new_rows)
+    load_table('.cache/go_api/data', columns=['id', 'country'])
+"""
+import os
+import json
+import glob
+
+import pandas
+
+from .common import load_json_from_file, dump_json_to_file
+
+try:
+    import pyarrow
+    import pyarrow.parquet as parquet
+except ImportError:
+    pyarrow = None
+
+PARQUET_EXTENSION = '.parquet'
+JSON_EXTENSION = '.json'
+# Parquet metadata key for columns with nested values
+JSON_COLUMNS_KEY = b'json_columns'
+PART_SUFFIX = '.part'
+MAX_TABLE_PARTS = 16
+
+
+def is_null(value):
+    return value is None or (isinstance(value, float) and value != value)
+
+
+def get_json_columns(dataframe):
+    return [
+        column for column in dataframe.columns
+        if dataframe[column].dtype == object and dataframe[column].map(
+            lambda value: not (is_null(value) or isinstance(value, str))
+        ).any()
+    ]
+
+
+def dump_parquet(filename, dataframe):
+    json_columns = get_json_columns(dataframe)
+    if json_columns:
+        dataframe = dataframe.copy()
+        for column in json_columns:
+            dataframe[column] = dataframe[column].map(
+                lambda value: None if is_null(value) else json.dumps(value)
+            )
+    table = pyarrow.Table.from_pandas(dataframe, preserve_index=False)
+    metadata = dict(table.schema.metadata or {})
+    metadata[JSON_COLUMNS_KEY] = json.dumps(json_columns).encode('utf-8')
+    table = table.replace_schema_metadata(metadata)
+    parquet.write_table(table, filename)
+
+
+def load_parquet(filename, columns=None):
+    table = parquet.read_table(filename, columns=columns, memory_map=True)
+    dataframe = table.to_pandas()
+    json_columns = json.loads(
+        (table.schema.metadata or {}).get(JSON_COLUMNS_KEY, b'[]').decode('utf-8')
+    )
+    for column in json_columns:
+        if column in dataframe.columns:
+            dataframe[column] = dataframe[column].map(
+                lambda value: json.loads(value) if isinstance(value, str) else None
+            )
+    return dataframe
+
+
+def get_table_parts(filename):
+    """
+    Appended parts of the table (filenames without extension) in append order
+    """
+    return sorted({
+        os.path.splitext(part)[0]
+        for part in glob.glob(glob.escape(filename + PART_SUFFIX) + '*')
+    })
+
+
+def dump_table(filename, dataframe):
+    """
+    filename: without extension
+    """
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    for part in get_table_parts(filename):
+        remove_file(part + PARQUET_EXTENSION)
+        remove_file(part + JSON_EXTENSION)
+    _dump_table(filename, dataframe)
+
+
+def _dump_table(filename, dataframe):
+    if pyarrow is not None:
+        dump_parquet(filename + PARQUET_EXTENSION, dataframe)
+        remove_file(filename + JSON_EXTENSION)
+    else:
+        dump_json_to_file(filename + JSON_EXTENSION, dataframe.to_dict('list'))
+        remove_file(filename + PARQUET_EXTENSION)
+
+
+def append_table(filename, dataframe):
+    """
+    Add dataframe rows after the stored rows (columns must match)
+    """
+    if not table_exists(filename):
+        dump_table(filename, dataframe)
+        return
+    parts = get_table_parts(filename)
+    if len(parts) + 1 >= MAX_TABLE_PARTS:
+        dump_table(filename, pandas.concat([load_table(filename), dataframe], ignore_index=True))
+        return
+    last = int(parts[-1][len(filename + PART_SUFFIX):]) if parts else 0
+    _dump_table('{}{}{:04d}'.format(filename, PART_SUFFIX, last + 1), dataframe)
+
+
+def load_table(filename, columns=None):
+    """
+    filename: without extension
+    columns: only load these columns (all if None)
+    """
+    dataframe = _load_table(filename, columns=columns)
+    parts = get_table_parts(filename)
+    if not parts:
+        return dataframe
+    return pandas.concat(
+        [dataframe] + [_load_table(part, columns=columns) for part in parts],
+        ignore_index=True,
+    )
+
+
+def _load_table(filename, columns=None):
+    if pyarrow is not None and os.path.exists(filename + PARQUET_EXTENSION):
+        return load_parquet(filename + PARQUET_EXTENSION, columns=columns)
+    # Raises FileNotFoundError if table is not stored
+    dataframe = pandas.DataFrame(load_json_from_file(filename + JSON_EXTENSION))
+    return dataframe if columns is None else dataframe[columns]
+
+
+def table_to_records(dataframe):
+    """
+    DataFrame -> [{column: value}] (with None instead of NaN)
+    """
+    return dataframe.astype(object).where(pandas.notnull(dataframe), None).to_dict('records')
+
+
+def table_exists(filename):
+    return (
+        (pyarrow is not None and os.path.exists(filename + PARQUET_EXTENSION)) or
+        os.path.exists(filename + JSON_EXTENSION)
+    )
+
+
+def remove_table(filename):
+    for part in [filename] + get_table_parts(filename):
+        remove_file(part + PARQUET_EXTENSION)
+        remove_file(part + JSON_EXTENSION)
+
+
+def remove_file(filename):
+    try:
+        os.remove(filename)
+    except FileNotFoundError:
+        pass
@@ -1,7 +1,8 @@
-import requests
 import json
 import logging
 
+from .http_client import get_client
+
 """
 Ref: https://github.com/sdmx-twg/sdmx-rest/wiki/Data-queries
 """
@@ -17,7 +18,7 @@ def clean_array(array):
 
 
 def pull_data(url, data_collector=[]):
-    response = requests.get(
+    response = get_client().get(
         url, headers=DEFAULT_HEADERS
     )
     return response.text
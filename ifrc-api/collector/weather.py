@@ -1,18 +1,37 @@
-import cdsapi
-import pygrib
+import json
+import asyncio
+from os.path import join as path_join
 
-from .country import countries
-from .common import sync_fetch
+import pandas
+
+from .config import NotTestException
+from .country import get_countries_iso3, get_country_iso2, get_country_iso3
+from .storage import dump_table, load_table
+from .http_client import get_client
 
 
 """
 https://datahelpdesk.worldbank.org/knowledgebase/articles/902061-climate-data-api
+
+mavg: [{gcm, variable, fromYear, toYear, monthVals: [jan..dec]}] (one per climate model)
 """
 WB_ENDPOINT = 'http://climatedataapi.worldbank.org/climateweb/rest/v1'
 WB_API = WB_ENDPOINT + '/country/{type}/{var}/{start}/{end}/{ISO3}'
+# Monthly average precipitation (mm)
+CLIMATE_PARAMS = {'type': 'mavg', 'var': 'pr', 'start': '2008', 'end': '2018'}
+# Concurrent requests
+CLIMATE_CONCURRENCY = 8
+MONTHS = [
+    'jan', 'feb', 'mar', 'apr', 'may', 'jun',
+    'jul', 'aug', 'sep', 'oct', 'nov', 'dec',
+]
 
 
 def run_cdsapi():
+    # Optional dependencies (cdsapi, pygrib), only required here
+    import cdsapi
+    import pygrib
+
     c = cdsapi.Client(
         url='https://cds.climate.copernicus.eu/api/v2',
         key='2496:2790f5a7-b4b7-47d5-9a3f-eeeb7fd47d3b',
@@ -44,24 +63,100 @@ def run_cdsapi():
         print(grb.values)
 
 
-def request_exception_handler(request, exception):
-    print('{} Failed'.format(request.url))
+def get_climate_url(iso3):
+    return WB_API.format(ISO3=iso3, **CLIMATE_PARAMS)
 
 
-def run_wb():
-    urls = [
-        WB_API.format(
-            type='mavg',
-            var='pr',
-            start='2008',
-            end='2018',
-            ISO3=country['iso3'],
-        ) for country in countries
+def get_monthly_values(data):
+    """
+    mavg response -> [jan..dec] mean over the climate models (None if not provided)
+    """
+    months = [
+        model['monthVals'] for model in data or []
+        if isinstance(model, dict) and len(model.get('monthVals') or []) == len(MONTHS)
     ]
-    resps = sync_fetch(
-        urls,
-        headers={},
-        exception_handler=request_exception_handler
-    )
-    for r in resps:
-        print(r['url'], r['json'])
+    if not months:
+        return None
+    return [sum(values) / len(values) for values in zip(*months)]
+
+
+def run_wb(countries_iso3=None):
+    """
+    Pull monthly values of all countries concurrently (responses are cached
+    by the http client)
+    returns {iso3: [jan..dec]}, failed/empty countries are skipped
+    """
+    client = get_client()
+    countries_iso3 = get_countries_iso3() if countries_iso3 is None else countries_iso3
+
+    async def pull_country(semaphore, iso3):
+        async with semaphore:
+            response = await client.request('GET', get_climate_url(iso3))
+        if response.status != 200:
+            raise Exception('{} Failed ({})'.format(response.url, response.status))
+        return get_monthly_values(response.json())
+
+    async def pull_countries():
+        semaphore = asyncio.Semaphore(CLIMATE_CONCURRENCY)
+        return await asyncio.gather(
+            *[pull_country(semaphore, iso3) for iso3 in countries_iso3],
+            return_exceptions=True,
+        )
+
+    climate = {}
+    for iso3, values in zip(countries_iso3, client.run(pull_countries())):
+        if isinstance(values, Exception):
+            print('Climate failed for {}: {}'.format(iso3, repr(values)))
+        elif values is not None:
+            climate[iso3] = values
+    return climate
+
+
+class ClimateApi():
+    """
+    Monthly climate values by country stored as table: iso2, iso3, jan..dec
+    """
+    DATA_FILENAME = 'data'
+
+    def __init__(self, path, test=False):
+        self.data_filename = path_join(path, ClimateApi.DATA_FILENAME)
+        self.data = None
+
+        try:
+            if not test:
+                raise NotTestException()
+            self.data = load_table(self.data_filename)
+            print('Using Local Climate Data')
+        except (
+                TypeError, FileNotFoundError, json.decoder.JSONDecodeError,
+                NotTestException,
+        ):
+            self.load_data(test)
+        self.values = {
+            iso2: [None if value != value else value for value in values]
+            for iso2, values in zip(self.data['iso2'], self.data[MONTHS].values.tolist())
+        }
+
+    def load_data(self, test=False):
+        print('Pulling Climate Data')
+        countries_iso3 = get_countries_iso3()
+        if test:
+            countries_iso3 = countries_iso3[:5]
+        climate = run_wb(countries_iso3)
+        self.data = pandas.DataFrame(
+            [
+                [get_country_iso2(iso3), iso3] + values
+                for iso3, values in climate.items()
+            ],
+            columns=['iso2', 'iso3'] + MONTHS,
+        )
+        dump_table(self.data_filename, self.data)
+
+    def get_source_url(self, iso2):
+        return get_climate_url(get_country_iso3(iso2))
+
+    def get_data(self, iso2):
+        """
+        [jan..dec] (None if not available)
+        """
+        return self.values.get(iso2.upper())
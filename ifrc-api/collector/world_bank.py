@@ -0,0 +1,306 @@
+'''
+World Bank indicators
+https://api.worldbank.org/v2/country/IRQ;NPL/indicator/SP.POP.TOTL?format=json&per_page=1000&date=2008:2018
+
+All indicators are pulled concurrently, countries in batches (semicolon
+joined iso3) following every page of each batch (pages are cached by the
+http client). Values are stored as one table: iso2, iso3, indicator, year, value
+
+A batch with a code unknown to the World Bank (e.g. ATA, TWN) is rejected as
+a whole ([{'message': [...]}]), so only World Bank economies are requested
+(see get_economies) and rejected batches are split in halves. Countries still
+failing are skipped (and reported), the run goes on. An indicator unknown to
+the api is skipped (and reported) as a whole, like failed countries in
+weather.run_wb.
+'''
+import json
+import asyncio
+from os.path import join as path_join
+
+import pandas
+
+from .config import WorldBankSettings, NotTestException
+from .country import get_countries_iso3, get_country_iso2
+from .http_client import get_client
+from .storage import dump_table, load_table
+
+API_URL = 'https://api.worldbank.org/v2/country/{}/indicator/{}'
+COUNTRIES_URL = 'https://api.worldbank.org/v2/country'
+WB_DATE = '2008:2018'
+# Also used for the population block
+POPULATION_INDICATOR = 'SP.POP.TOTL'
+# iso3 per request (keeps the url short)
+WB_BATCH_SIZE = 50
+WB_PER_PAGE = 1000
+# Concurrent page requests (for all indicators)
+WB_CONCURRENCY = 8
+# Failed pages are pulled again up to this many times
+WB_PAGE_ROUNDS = 3
+# Error message id for an indicator code unknown to the api
+WB_INDICATOR_NOT_FOUND = '175'
+TABLE_COLUMNS = ['iso2', 'iso3', 'indicator', 'year', 'value']
+
+
+class WorldBankError(Exception):
+    """
+    Request rejected by the api (error message instead of data)
+    """
+
+
+def get_economies():
+    """
+    iso3 of the countries (and aggregates) known to the World Bank
+    None if not pulled
+    """
+    try:
+        response = get_client().get(
+            COUNTRIES_URL, params={'format': 'json', 'per_page': WB_PER_PAGE},
+        )
+        return {country['id'] for country in response.json()[1]}
+    except Exception as e:
+        print('World Bank countries not pulled: {}'.format(repr(e)))
+
+
+class IndicatorPull():
+    """
+    Pages of one indicator for all countries
+    """
+
+    def __init__(self, indicator, countries_iso3, date=WB_DATE):
+        self.indicator = indicator
+        self.date = date
+        self.batches = [
+            countries_iso3[index:index + WB_BATCH_SIZE]
+            for index in range(0, len(countries_iso3), WB_BATCH_SIZE)
+        ]
+        # batch index: {page: records}
+        self.pages = {index: {} for index in range(len(self.batches))}
+        # batch index: number of pages
+        self.page_counts = {}
+        # Batch indexes rejected by the api (in the last round)
+        self.rejected = set()
+        # Single country batches rejected by the api, not pulled again
+        self.skipped = set()
+        # Error message if the indicator was rejected (nothing is pulled then)
+        self.failed = None
+
+    async def pull_page(self, client, semaphore, index, page):
+        async with semaphore:
+            response = await client.request(
+                'GET', API_URL.format(';'.join(self.batches[index]), self.indicator),
+                params={
+                    'format': 'json', 'per_page': WB_PER_PAGE, 'date': self.date, 'page': page,
+                },
+            )
+        if response.status != 200:
+            raise Exception('World Bank {} page {} failed ({})'.format(
+                self.indicator, page, response.status,
+            ))
+        data = response.json()
+        # Errors are returned as [{'message': [...]}]
+        if not isinstance(data, list) or len(data) < 2:
+            messages = data[0].get('message') if data and isinstance(data[0], dict) else None
+            for message in messages or []:
+                if isinstance(message, dict) and message.get('id') == WB_INDICATOR_NOT_FOUND:
+                    self.failed = message.get('value') or message.get('key')
+            if self.failed is None:
+                self.rejected.add(index)
+            raise WorldBankError('World Bank {} rejected {}: {}'.format(
+                self.indicator, ';'.join(self.batches[index]), data,
+            ))
+        self.page_counts[index] = data[0]['pages']
+        self.pages[index][page] = data[1] or []
+
+    async def pull_batch(self, client, semaphore, index):
+        if 1 not in self.pages[index]:
+            await self.pull_page(client, semaphore, index, 1)
+        errors = [
+            error for error in await asyncio.gather(*[
+                self.pull_page(client, semaphore, index, page)
+                for page in range(2, self.page_counts[index] + 1)
+                if page not in self.pages[index]
+            ], return_exceptions=True)
+            if error is not None
+        ]
+        if errors:
+            raise errors[0]
+
+    def get_missing(self):
+        if self.failed is not None:
+            return []
+        return [
+            index for index in self.pages
+            if index not in self.skipped and (
+                index not in self.page_counts or
+                len(self.pages[index]) < self.page_counts[index]
+            )
+        ]
+
+    def split_rejected(self):
+        """
+        Rejected batches are pulled again in halves (down to single countries)
+        returns True if any batch was split
+        """
+        split = False
+        if self.failed is not None:
+            self.rejected = set()
+        for index in self.rejected:
+            batch = self.batches[index]
+            if len(batch) == 1:
+                self.skipped.add(index)
+                continue
+            for half in [batch[:len(batch) // 2], batch[len(batch) // 2:]]:
+                self.batches.append(half)
+                self.pages[len(self.batches) - 1] = {}
+            # Replaced by the halves
+            self.batches[index] = []
+            self.pages.pop(index)
+            self.page_counts.pop(index, None)
+            split = True
+        self.rejected = set()
+        return split
+
+    def get_failed_countries(self):
+        return [
+            iso3 for index in self.get_missing() + sorted(self.skipped)
+            for iso3 in self.batches[index]
+        ]
+
+    def get_records(self):
+        # Batches with missing pages are skipped (not partially used)
+        missing = set(self.get_missing())
+        return [
+            record
+            for index in self.pages if index not in missing
+            for page in sorted(self.pages[index])
+            for record in self.pages[index][page]
+        ]
+
+
+def pull_indicators(indicators, countries_iso3, date=WB_DATE):
+    """
+    Pull values of all indicators for all countries
+    returns {indicator: records as provided by the World Bank api}
+    Countries and indicators which failed are skipped (and reported)
+    """
+    client = get_client()
+    economies = get_economies()
+    if economies is not None:
+        unknown = [iso3 for iso3 in countries_iso3 if iso3 not in economies]
+        if unknown:
+            print('World Bank skipped for {} (not World Bank economies)'.format(
+                ';'.join(unknown),
+            ))
+        countries_iso3 = [iso3 for iso3 in countries_iso3 if iso3 in economies]
+    pulls = [IndicatorPull(indicator, countries_iso3, date) for indicator in indicators]
+
+    async def pull_batches():
+        semaphore = asyncio.Semaphore(WB_CONCURRENCY)
+        return await asyncio.gather(*[
+            pull.pull_batch(client, semaphore, index)
+            for pull in pulls for index in pull.get_missing()
+        ], return_exceptions=True)
+
+    rounds = 0
+    while rounds < WB_PAGE_ROUNDS and any(pull.get_missing() for pull in pulls):
+        errors = [error for error in client.run(pull_batches()) if error is not None]
+        for error in errors:
+            print('Failed to pull World Bank page: {}'.format(repr(error)))
+        # Split batches are pulled in an extra round
+        if not any([pull.split_rejected() for pull in pulls]):
+            rounds += 1
+    for pull in pulls:
+        if pull.failed is not None:
+            print('World Bank {} skipped: {}'.format(pull.indicator, pull.failed))
+            continue
+        failed = pull.get_failed_countries()
+        if failed:
+            print('World Bank {} skipped for {}'.format(pull.indicator, ';'.join(failed)))
+    return {
+        pull.indicator: pull.get_records() for pull in pulls if pull.failed is None
+    }
+
+
+def records_to_table(indicator_records):
+    """
+    {indicator: records} -> DataFrame (TABLE_COLUMNS)
+    """
+    rows = []
+    for indicator, records in indicator_records.items():
+        for record in records:
+            iso3 = record.get('countryiso3code') or ''
+            iso2 = get_country_iso2(iso3)
+            if not iso2:
+                continue
+            rows.append((iso2, iso3, indicator, int(record['date']), record['value']))
+    data = pandas.DataFrame(rows, columns=TABLE_COLUMNS)
+    data['value'] = pandas.to_numeric(data['value'], errors='coerce').astype(float)
+    return data
+
+
+def normalize_value(value):
+    """
+    NaN -> None, 1000.0 -> 1000 (table values are float)
+    """
+    if value is None or value != value:
+        return None
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+class WorldBankApi():
+    DATA_FILENAME = 'data'
+
+    def __init__(self, path, indicators=None, test=False):
+        """
+        indicators: World Bank indicator codes (default: WorldBankSettings.indicators)
+        """
+        self.indicators = list(indicators or WorldBankSettings.indicators)
+        self.data_filename = path_join(path, WorldBankApi.DATA_FILENAME)
+        self.data = None
+
+        try:
+            if not test:
+                raise NotTestException()
+            self.data = load_table(self.data_filename, columns=TABLE_COLUMNS)
+            if not set(self.indicators) <= set(self.data['indicator']):
+                raise FileNotFoundError()
+            print('Using Local World Bank Data')
+        except (
+                TypeError, KeyError, FileNotFoundError, json.decoder.JSONDecodeError,
+                NotTestException,
+        ):
+            self.load_data(test)
+        self.values = self.get_values(self.data, self.indicators)
+
+    def load_data(self, test=False):
+        print('Pulling World Bank Data ({} indicators)'.format(len(self.indicators)))
+        countries_iso3 = get_countries_iso3()
+        if test:
+            countries_iso3 = countries_iso3[:5]
+        self.data = records_to_table(pull_indicators(self.indicators, countries_iso3))
+        dump_table(self.data_filename, self.data)
+
+    @staticmethod
+    def get_values(data, indicators):
+        """
+        {iso2: {indicator: [{'date': year, 'value': value}]}} (latest year first)
+        """
+        values = {}
+        data = data[data['indicator'].isin(indicators)].sort_values(
+            ['iso2', 'indicator', 'year'], ascending=[True, True, False],
+        )
+        for iso2, indicator, year, value in zip(
+                data['iso2'], data['indicator'], data['year'], data['value'],
+        ):
+            values.setdefault(iso2, {}).setdefault(indicator, []).append({
+                'date': str(year), 'value': normalize_value(value),
+            })
+        return values
+
+    def get_data(self, iso2):
+        return self.values.get(iso2.upper(), {})
+
+    def get_indicator(self, iso2, indicator):
+        return self.get_data(iso2).get(indicator, [])
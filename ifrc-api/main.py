@@ -12,26 +12,56 @@ load_dotenv(os.path.join(BASE_DIR, '.env'))
 
 @click.command()
 @click.option(
-    '--output-file', prompt='Output file', help='Output file'
+    '--output-file', prompt='Output file',
+    help='Output file (.json, or .ndjson for one region/country per line)'
 )
 @click.option(
     '--test', default='False', help='Test Run. Few Countries are collected'
 )
-def run(output_file, test):
+@click.option(
+    '--workers', default=1, type=int, help='Number of countries collected concurrently'
+)
+@click.option(
+    '--reliefweb-bulk/--no-reliefweb-bulk', default=True,
+    help='Pull ReliefWeb data for all countries at once instead of per country'
+)
+@click.option(
+    '--http-cache/--no-http-cache', default=True,
+    help='Reuse http responses cached under .cache/http'
+)
+@click.option(
+    '--incremental/--no-incremental', default=False,
+    help='Reuse countries with unchanged source data from the existing output file'
+)
+@click.option(
+    '--resume', is_flag=True, default=False,
+    help='Continue the last failed run from its checkpoint journal (.cache/collector)'
+)
+def run(output_file, test, workers, reliefweb_bulk, http_cache, incremental, resume):
     from collector import GoDataSourceCollector
     from collector.common import seconds_to_human_readable
+    from collector.metrics import metrics, get_metrics_filename
 
     start = time.time()
 
     hpc_credential = os.environ.get('HPC_CREDENTIAL')
 
-    collector = GoDataSourceCollector(
-        path='.cache',
-        hpc_credential=hpc_credential,
-        test=test.lower() == 'true',
-    )
-    collector.collect()
-    collector.dump_json(output_file)
+    try:
+        collector = GoDataSourceCollector(
+            path='.cache',
+            hpc_credential=hpc_credential,
+            test=test.lower() == 'true',
+            workers=workers,
+            reliefweb_bulk=reliefweb_bulk,
+            http_cache=http_cache,
+        )
+        collector.collect(
+            previous_output=output_file if incremental else None, resume=resume,
+            output_file=output_file,
+        )
+    finally:
+        # Also dumped for failed runs
+        metrics.dump(get_metrics_filename(output_file))
 
     print(seconds_to_human_readable(time.time() - start))
 